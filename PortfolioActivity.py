@@ -20,11 +20,14 @@ from gi.repository import GdkPixbuf
 from gi.repository import GObject
 from gi.repository import Pango
 from gi.repository import PangoCairo
+import cairo
 
 import os
 from shutil import copyfile
+from collections import OrderedDict, deque
 
 from math import sqrt, ceil
+from base64 import b64encode
 
 from sugar3.activity import activity
 from sugar3 import profile
@@ -36,14 +39,21 @@ from sugar3.graphics.toolbarbox import ToolbarButton
 
 from sugar3.datastore import datastore
 from sugar3.graphics.alert import Alert
+from sugar3.graphics.icon import Icon
 
 from sprites import (Sprites, Sprite)
-from utils import (get_path, lighter_color, svg_str_to_pixbuf, svg_rectangle,
-                   get_pixbuf_from_journal, genblank, get_hardware, rgb,
-                   pixbuf_to_base64, base64_to_pixbuf, get_pixbuf_from_file,
+from utils import (get_path, lighter_color, blank_surface, rectangle_surface,
+                   get_pixbuf_from_journal, get_hardware, rgb,
+                   pixbuf_to_png, base64_to_pixbuf, data_to_pixbuf,
+                   get_pixbuf_from_file,
                    parse_comments, get_tablet_mode)
+from previewcache import PreviewCache
+from previewbudget import PreviewBudget
+from journalwriter import JournalWriter
+from encoder import PreviewEncoder
 from odp import TurtleODP
-from exportpdf import save_pdf
+from exportpdf import PDFJob, PDF_QUALITIES
+from sliderenderer import SlideRenderer
 from toolbar_utils import (radio_factory, button_factory, separator_factory,
                            combo_factory, label_factory)
 from grecord import Grecord
@@ -58,6 +68,7 @@ from sugar3.graphics import style
 GRID_CELL_SIZE = style.GRID_CELL_SIZE
 
 import json
+import hashlib
 
 import telepathy
 from dbus.service import signal
@@ -65,9 +76,9 @@ from dbus.gobject_service import ExportedGObject
 from sugar3.presence import presenceservice
 
 try:
-    from sugar3.presence.wrapper import CollabWrapper
+    from sugar3.presence.wrapper import CollabWrapper, FT_STATE_COMPLETED
 except ImportError:
-    from collabwrapper import CollabWrapper
+    from collabwrapper import CollabWrapper, FT_STATE_COMPLETED
 
 
 SERVICE = 'org.sugarlabs.PortfolioActivity'
@@ -96,6 +107,9 @@ UNIT_DICTIONARY = {TWO: (UNITS[TWO], 2),
                    THIRTY: (UNITS[THIRTY], 30),
                    SIXTY: (UNITS[SIXTY], 60)}
 
+# Labels for exportpdf.PDF_QUALITIES
+QUALITIES = [_('Draft PDF'), _('Normal PDF'), _('High quality PDF')]
+
 # sprite layers
 DRAG = 6
 STAR = 5
@@ -107,6 +121,22 @@ HIDE = 0
 
 OSK_SHIFT = 200
 
+# The thumbnail view scrolls by rows once the portfolio no longer fits
+# this many columns; sprites are only kept for the rows on screen plus
+# this many rows above and below.
+MAX_THUMB_COLUMNS = 6
+THUMB_MARGIN_ROWS = 1
+
+# Bump when the contents of a slide hash (see _slide_hash) change
+SYNC_VERSION = 1
+
+# Seconds without further edits before a slide is saved to the Journal
+AUTOSAVE_DELAY = 3
+
+# Previews evicted from memory that cannot be decoded from the Journal
+# again are kept in the preview cache under this mtime
+EVICTED = 'evicted'
+
 
 def _get_screen_dpi():
     xft_dpi = Gtk.Settings.get_default().get_property('gtk-xft-dpi')
@@ -114,25 +144,112 @@ def _get_screen_dpi():
     return dpi
 
 
-class Slide():
+def _get_mtime(dsobj):
+    ''' Return the modification time of a Journal object, or None if
+    it is unknown. '''
+    if not hasattr(dsobj, 'metadata'):
+        return None
+    if 'mtime' in dsobj.metadata:
+        return str(dsobj.metadata['mtime'])
+    if 'timestamp' in dsobj.metadata:
+        return str(dsobj.metadata['timestamp'])
+    return None
+
+
+class Slide(object):
 
     ''' A container for a slide '''
 
-    def __init__(self, owner, uid, colors, title, preview, desc, comment):
+    def __init__(self, owner, uid, colors, title, preview, desc, comment,
+                 budget):
         self.active = True
         self.owner = owner
         self.uid = uid
         self.colors = colors
         self.title = title
+        self._budget = budget  # The PreviewBudget accounting for previews
+        self._preview = None
+        self.preview_version = 0  # Bumped whenever the preview changes
+        self.evicted = None  # Size of the preview, if it was evicted
+        self.fallback = None  # Small copy of an evicted preview
         self.preview = preview
         self.preview2 = None  # larger version for fullscreen mode
         self.description = desc
         self.comment = comment  # A list of dictionaries
         self.sound = None
+        self.sound_searched = False  # Have we looked for an audio note?
         self.dirty = False
+        self.saved = {}  # Editable metadata, as in the Journal
         self.fav = True
         self.thumb = None
         self.star = None
+        self.mtime = None  # Journal mtime when the preview was decoded
+        self.encoded_preview = None  # (version, PNG data) sent to buddies
+        self.hash = None  # Content hash, as received from the sharer
+        self.shared_hash = None  # Content hash last sent to all buddies
+
+    @property
+    def preview(self):
+        ''' The preview pixbuf. An evicted preview is decoded again in
+        the background, and a placeholder is returned until it is back. '''
+        if self.restoring:
+            self._budget.restore(self)
+            return self._placeholder()
+        self._budget.touch(self)
+        return self._preview
+
+    @preview.setter
+    def preview(self, pixbuf):
+        self._preview = pixbuf
+        self.preview_version += 1
+        self.evicted = None
+        self.set_fallback(None)
+        self._budget.add(self, pixbuf)
+
+    @property
+    def has_preview(self):
+        ''' Is there a preview (even if it has been evicted)? '''
+        return self._preview is not None or self.evicted is not None
+
+    @property
+    def restoring(self):
+        ''' Is the preview evicted, so that a placeholder is shown? '''
+        return self._preview is None and self.evicted is not None
+
+    def restored(self, pixbuf):
+        ''' An evicted preview has been decoded again; pixbuf is None if
+        that failed. '''
+        if not self.restoring:
+            return  # It has been replaced in the meantime
+        if pixbuf is None:
+            pixbuf = self._placeholder()
+        self._preview = pixbuf
+        self.evicted = None
+        self.set_fallback(None)
+        self._budget.add(self, pixbuf)
+
+    def _placeholder(self):
+        ''' The small copy of the preview, if there is one, or else a
+        blank preview. '''
+        if self.fallback is not None:
+            return self.fallback
+        pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8,
+                                      *self.evicted)
+        pixbuf.fill(int(self.colors[1][1:7] + 'ff', 16))
+        return pixbuf
+
+    def set_fallback(self, pixbuf):
+        ''' Keep a copy of the preview to show if it cannot be decoded
+        again, counting it in the preview budget. '''
+        self.fallback = pixbuf
+        self._budget.hold(self, pixbuf)
+
+    def evict(self):
+        ''' Drop the preview to save memory and return it. '''
+        pixbuf = self._preview
+        self._preview = None
+        self.evicted = (pixbuf.get_width(), pixbuf.get_height())
+        return pixbuf
 
     def hide(self):
         if self.star is not None:
@@ -158,6 +275,7 @@ class PortfolioActivity(activity.Activity):
 
         self._playing = False
         self._first_time = True
+        self._pdf_quality = 'normal'
 
         self._set_scale_and_orientation()
 
@@ -171,16 +289,59 @@ class PortfolioActivity(activity.Activity):
         self._setup_toolbars()
         self._setup_canvas()
 
+        # Edits are written to the Journal in the background, shortly
+        # after editing a slide stops (slide -> timeout id)
+        self._journal_writer = JournalWriter(
+            datastore, written_cb=self.datastore_write_cb,
+            error_cb=self.datastore_write_error_cb)
+        self._autosave_ids = {}
+
         self._slides = []
+        # Registry for constant-time lookups: uid -> slide,
+        # thumb/star sprite -> slide, and slide -> position in _slides
+        self._uid_slides = {}
+        self._sprite_slides = {}
+        self._slide_positions = {}
         self._current_slide = 0
 
+        self._preview_cache = PreviewCache(
+            os.path.join(get_path(activity, 'data'), 'previews'))
+        # Decoded previews are evicted when they use too much memory
+        self._preview_budget = PreviewBudget(self._evict_preview,
+                                             self._restore_preview)
+
+        # Previews waiting to be decoded in the background (uid -> dsobj)
+        self._pending_previews = OrderedDict()
+        self._pending_restores = OrderedDict()  # uid -> evicted slide
+        self._decode_id = None
+
+        # Slides next to the one on display, waiting to be prepared, and
+        # the previews scaled for display (slide -> (version, w, h, pixbuf))
+        self._prefetch_queue = []
+        self._prefetch_id = None
+        self._scaled_previews = {}
+
         self._thumbnail_mode = False
+        # Thumbnail grid: the active slides in cell order, the cell of
+        # each slide, and the slides that have thumbnail sprites (only
+        # those in or near the visible rows). Sprites of thumbnails that
+        # scroll away are kept in pools for reuse.
+        self._thumb_cells = []
+        self._thumb_cell = {}
+        self._thumbed = set()
+        self._thumb_pool = []
+        self._star_pool = []
+        self._thumb_top_row = 0
+        self._thumb_geometry = (1, 1, 1, 1, 0)  # columns, rows, w, h, x_off
         self._find_starred()
         self._setup_workspace()
 
         self._recording = False
         self._grecord = None
         self._alert = None
+        self._pdf_job = None
+        self._odp_id = None
+        self._pdf_alert = None
 
         self._keypress = None
         self._selected_spr = None
@@ -189,6 +350,16 @@ class PortfolioActivity(activity.Activity):
         self._startpos = [0, 0]
         self._dragpos = [0, 0]
 
+        # Slides waiting to be sent to buddies, in order, and the slides
+        # whose previews are being encoded by the worker threads
+        self._share_queue = deque()
+        self._encoding = {}
+        self._encoder = PreviewEncoder()
+        # Buddies in the shared activity, and previews that arrived by
+        # file transfer before the slide they belong to (uid -> pixbuf)
+        self._collab_buddies = []
+        self._received_previews = {}
+
         self._setup_presence_service()
 
     def _set_xy_wh(self):
@@ -267,10 +438,12 @@ class PortfolioActivity(activity.Activity):
         self._canvas.add_events(Gdk.EventMask.POINTER_MOTION_MASK)
         self._canvas.add_events(Gdk.EventMask.BUTTON_RELEASE_MASK)
         self._canvas.add_events(Gdk.EventMask.KEY_PRESS_MASK)
+        self._canvas.add_events(Gdk.EventMask.SCROLL_MASK)
         self._canvas.connect('draw', self._draw_cb)
         self._canvas.connect('button-press-event', self._button_press_cb)
         self._canvas.connect('button-release-event', self._button_release_cb)
         self._canvas.connect('motion-notify-event', self._mouse_move_cb)
+        self._canvas.connect('scroll-event', self._scroll_cb)
         self._canvas.connect('key-press-event', self._keypress_cb)
         Gdk.Screen.get_default().connect('size-changed', self._configure_cb)
 
@@ -405,10 +578,9 @@ class PortfolioActivity(activity.Activity):
 
         self._preview = Sprite(self._sprites,
                                0, 0,
-                               svg_str_to_pixbuf(genblank(
-                                   int(self._preview_wh[0]),
-                                   int(self._preview_wh[1]),
-                                   self._colors)))
+                               blank_surface(int(self._preview_wh[0]),
+                                             int(self._preview_wh[1]),
+                                             self._colors))
 
         self._configured_sprites()  # Some sprites are sized to screen
 
@@ -438,19 +610,17 @@ class PortfolioActivity(activity.Activity):
         self._title = Sprite(
             self._sprites, int(
                 self._title_xy[0]), int(
-                self._title_xy[1]), svg_str_to_pixbuf(
-                genblank(
-                    self._title_wh[0], self._title_wh[1], self._colors)))
+                self._title_xy[1]), blank_surface(
+                self._title_wh[0], self._title_wh[1], self._colors))
         self._title.set_label_attributes(self.title_size, rescale=False)
         self._title.type = 'title'
 
         self._description = Sprite(self._sprites,
                                    int(self._desc_xy[0]),
                                    int(self._desc_xy[1]),
-                                   svg_str_to_pixbuf(
-                                       genblank(int(self._desc_wh[0]),
-                                                int(self._desc_wh[1]),
-                                                self._colors)))
+                                   blank_surface(int(self._desc_wh[0]),
+                                                 int(self._desc_wh[1]),
+                                                 self._colors))
         self._description.set_label_attributes(self.desc_size,
                                                horiz_align="left",
                                                rescale=False, vert_align="top")
@@ -461,10 +631,9 @@ class PortfolioActivity(activity.Activity):
         self._comment = Sprite(self._sprites,
                                int(self._comment_xy[0]),
                                int(self._comment_xy[1]),
-                               svg_str_to_pixbuf(
-                                   genblank(int(self._comment_wh[0]),
-                                            int(self._comment_wh[1]),
-                                            self._colors)))
+                               blank_surface(int(self._comment_wh[0]),
+                                             int(self._comment_wh[1]),
+                                             self._colors))
         self._comment.set_label_attributes(int(self.desc_size * 0.67),
                                            vert_align="top",
                                            horiz_align="left",
@@ -473,10 +642,9 @@ class PortfolioActivity(activity.Activity):
         self._new_comment = Sprite(self._sprites,
                                    int(self._new_comment_xy[0]),
                                    int(self._new_comment_xy[1]),
-                                   svg_str_to_pixbuf(
-                                       genblank(int(self._new_comment_wh[0]),
-                                                int(self._new_comment_wh[1]),
-                                                self._colors)))
+                                   blank_surface(int(self._new_comment_wh[0]),
+                                                 int(self._new_comment_wh[1]),
+                                                 self._colors))
         self._new_comment.set_label_attributes(self.desc_size,
                                                horiz_align="left",
                                                vert_align="top", rescale=False)
@@ -484,9 +652,9 @@ class PortfolioActivity(activity.Activity):
         self._new_comment.set_label(_('Enter comments here.'))
 
         self._my_canvas = Sprite(
-            self._sprites, 0, 0, svg_str_to_pixbuf(genblank(
+            self._sprites, 0, 0, blank_surface(
                 self._width, self._height, (self._colors[0],
-                                            self._colors[0]))))
+                                            self._colors[0])))
         self._my_canvas.set_layer(BOTTOM)
         self._my_canvas.type = 'background'
 
@@ -540,6 +708,14 @@ class PortfolioActivity(activity.Activity):
 
         separator_factory(adjust_toolbar)
 
+        self._quality_combo = combo_factory(
+            QUALITIES, adjust_toolbar, self._quality_combo_cb,
+            default=QUALITIES[PDF_QUALITIES.index(self._pdf_quality)],
+            tooltip=_('PDF export quality'))
+        self._quality_combo.show()
+
+        separator_factory(adjust_toolbar)
+
         button_factory('system-restart',
                        adjust_toolbar,
                        self._rescan_cb,
@@ -586,43 +762,101 @@ class PortfolioActivity(activity.Activity):
     def _thumb_to_slide(self, spr):
         if spr is None:
             return None
-        for slide in self._slides:
-            if slide.thumb == spr:
-                return slide
+        slide = self._sprite_slides.get(spr)
+        if slide is not None and slide.thumb == spr:
+            return slide
         return None
 
     def _star_to_slide(self, spr):
         if spr is None:
             return None
-        for slide in self._slides:
-            if slide.star == spr:
-                return slide
+        slide = self._sprite_slides.get(spr)
+        if slide is not None and slide.star == spr:
+            return slide
         return None
 
     def _uid_to_slide(self, uid):
-        for slide in self._slides:
-            if slide.uid == uid:
-                return slide
-        return None
+        return self._uid_slides.get(uid)
+
+    def _slide_index(self, slide):
+        ''' Return the position of a slide in the slide list. '''
+        return self._slide_positions[slide]
+
+    def _add_slide(self, slide):
+        ''' Append a slide to the slide list and register it. '''
+        self._slide_positions[slide] = len(self._slides)
+        self._slides.append(slide)
+        self._uid_slides[slide.uid] = slide
+
+    def _set_thumb(self, slide, spr):
+        ''' Assign (or clear) the thumbnail sprite of a slide. '''
+        if slide.thumb is not None:
+            self._sprite_slides.pop(slide.thumb, None)
+        slide.thumb = spr
+        if spr is not None:
+            self._sprite_slides[spr] = slide
+            self._thumbed.add(slide)
 
     def _make_star(self, slide):
-        slide.star = Sprite(self._sprites, 0, 0, self._fav_pixbuf)
-        slide.star.type = 'star'
+        ''' Give a slide a star sprite, reusing one from the pool. '''
+        if slide.fav:
+            pixbuf = self._fav_pixbuf
+        else:
+            pixbuf = self._unfav_pixbuf
+        if len(self._star_pool) > 0:
+            slide.star = self._star_pool.pop()
+            slide.star.set_image(pixbuf)
+        else:
+            slide.star = Sprite(self._sprites, 0, 0, pixbuf)
+        if slide.fav:
+            slide.star.type = 'star'
+        else:
+            slide.star.type = 'unstar'
         slide.star.set_layer(STAR)
-        slide.fav = True
+        self._sprite_slides[slide.star] = slide
+
+    def _release_thumb(self, slide):
+        ''' Hide the thumbnail and star of a slide and return their
+        sprites to the pools. '''
+        if slide.thumb is not None:
+            slide.thumb.hide()
+            self._thumb_pool.append(slide.thumb)
+            self._set_thumb(slide, None)
+        if slide.star is not None:
+            slide.star.hide()
+            self._sprite_slides.pop(slide.star, None)
+            self._star_pool.append(slide.star)
+            slide.star = None
+        self._thumbed.discard(slide)
 
     def _find_starred(self):
-        ''' Find all the _stars in the Journal. '''
+        ''' Find all the _stars in the Journal. Entries whose mtime has
+        not changed since the last scan keep their slide and preview;
+        previews of new or modified entries are queued for decoding in
+        the background. '''
         for slide in self._slides:
             slide.active = False
+        pending = self._pending_previews
+        self._pending_previews = OrderedDict()
         self.dsobjects, self._nobjects = datastore.find({'keep': '1'})
+        self._index_audio_notes()
         for dsobj in self.dsobjects:
             slide = self._uid_to_slide(dsobj.object_id)
+            mtime = _get_mtime(dsobj)
+            if slide is not None and mtime is not None and \
+               slide.mtime == mtime:
+                _logger.debug('%s is unchanged' % (dsobj.object_id))
+                if dsobj.object_id in pending:
+                    self._pending_previews[dsobj.object_id] = dsobj
+                slide.active = True
+                slide.fav = True
+                slide.hide()
+                continue
+
             owner = self._buddies[0]
             title = ''
             desc = ''
             comment = []
-            preview = None
             if hasattr(dsobj, 'metadata'):
                 if 'title' in dsobj.metadata:
                     title = dsobj.metadata['title']
@@ -634,48 +868,178 @@ class PortfolioActivity(activity.Activity):
                         _logger.debug(comment)
                     except:
                         comment = []
-                if 'mime_type' in dsobj.metadata and \
-                   dsobj.metadata['mime_type'][0:5] == 'image':
-                    preview = get_pixbuf_from_file(
-                        dsobj.file_path,
-                        int(PREVIEW[self._orientation][2] * self._scale),
-                        int(PREVIEW[self._orientation][3] * self._scale))
-                elif 'preview' in dsobj.metadata:
-                    preview = get_pixbuf_from_journal(dsobj, 300, 225)
+                self._pending_previews[dsobj.object_id] = dsobj
             else:
                 _logger.debug('dsobj has no metadata')
 
             if slide is None:
-                self._slides.append(Slide(owner,
-                                          dsobj.object_id,
-                                          self._colors,
-                                          title,
-                                          preview,
-                                          desc,
-                                          comment))
+                slide = Slide(owner,
+                              dsobj.object_id,
+                              self._colors,
+                              title,
+                              None,
+                              desc,
+                              comment,
+                              self._preview_budget)
+                self._add_slide(slide)
             else:
+                # Keep showing the old preview until the new one is ready
                 slide.title = title
-                slide.preview = preview
                 slide.description = desc
                 slide.comment = comment
                 slide.active = True
                 slide.fav = True
-                if slide.star is not None:
-                    slide.star.hide()
-                if slide.thumb is not None:
-                    slide.thumb.hide()
+                slide.hide()
+            slide.mtime = mtime
+            slide.saved = self._slide_metadata(slide)
+
+        for slide in self._slides:
+            if not slide.active:
+                # Send it again in full if it comes back
+                slide.shared_hash = None
+
+        if len(self._pending_previews) > 0 and self._decode_id is None:
+            self._decode_id = GObject.idle_add(self._decode_previews_cb)
+
+    def _decode_previews_cb(self):
+        ''' Decode one pending preview per idle call: evicted previews
+        that are wanted again first, then new ones, starting with the
+        slide currently on display. '''
+        if len(self._pending_restores) > 0:
+            uid, slide = self._pending_restores.popitem(last=False)
+            if slide.restoring:
+                slide.restored(self._decode_evicted(slide))
+                self._preview_ready(slide)
+        elif len(self._pending_previews) > 0:
+            uid = None
+            if not self._thumbnail_mode and \
+               0 <= self.i < len(self._slides):
+                if self._slides[self.i].uid in self._pending_previews:
+                    uid = self._slides[self.i].uid
+            if uid is None:
+                uid = next(iter(self._pending_previews))
+            dsobj = self._pending_previews.pop(uid)
+
+            slide = self._uid_to_slide(uid)
+            if slide is not None:
+                try:
+                    slide.preview = self._get_preview(dsobj)
+                except Exception as e:
+                    _logger.error('Could not decode preview for %s: %s' %
+                                  (uid, e))
+                    slide.preview = None
+                self._preview_ready(slide)
+
+        if len(self._pending_restores) == 0 and \
+           len(self._pending_previews) == 0:
+            self._decode_id = None
+            self._preview_cache.sync()
+            return False
+        return True
+
+    def _preview_ready(self, slide):
+        ''' A preview has been (re)decoded: refresh whatever shows it. '''
+        if not slide.active:
+            return
+        if slide.thumb is not None:
+            # The thumbnail is out of date
+            self._release_thumb(slide)
+            if self._thumbnail_mode:
+                self._place_thumb(slide)
+        if not self._thumbnail_mode and self._slide_index(slide) == self.i:
+            self._show_preview(slide)
+        if self.initiating:
+            self._share_slide(slide, changed_only=True)
+
+    def _get_preview(self, dsobj):
+        ''' Decode a preview pixbuf for a Journal object, unless there
+        is an up-to-date copy in the preview cache. '''
+        is_image = 'mime_type' in dsobj.metadata and \
+            dsobj.metadata['mime_type'][0:5] == 'image'
+        if is_image:
+            w = int(PREVIEW[self._orientation][2] * self._scale)
+            h = int(PREVIEW[self._orientation][3] * self._scale)
+        elif 'preview' in dsobj.metadata:
+            w = 300
+            h = 225
+        else:
+            return None
+
+        mtime = _get_mtime(dsobj)
+        pixbuf = self._preview_cache.get(dsobj.object_id, w, h, mtime)
+        if pixbuf is None:
+            if is_image:
+                pixbuf = get_pixbuf_from_file(dsobj.file_path, w, h)
+            else:
+                pixbuf = get_pixbuf_from_journal(dsobj, w, h)
+            self._preview_cache.put(dsobj.object_id, w, h, mtime, pixbuf)
+        return pixbuf
+
+    def _evict_preview(self, slide):
+        ''' Decoded previews are using too much memory: let this one go.
+        Previews that are not in our Journal are kept in the preview
+        cache, with a small copy in memory in case that fails. '''
+        pixbuf = slide.evict()
+        w, h = slide.evicted
+        if slide.mtime is None:
+            # Received from the sharer, so not in our Journal
+            slide.set_fallback(pixbuf.scale_simple(
+                max(1, int(w / 4)), max(1, int(h / 4)),
+                GdkPixbuf.InterpType.TILES))
+            self._preview_cache.put(slide.uid, w, h, EVICTED, pixbuf,
+                                    kind='evicted')
+
+    def _restore_preview(self, slide):
+        ''' An evicted preview is wanted again: queue it for decoding
+        ahead of new previews. '''
+        self._pending_restores[slide.uid] = slide
+        if self._decode_id is None:
+            self._decode_id = GObject.idle_add(self._decode_previews_cb)
+
+    def load_preview(self, slide):
+        ''' Return the preview of a slide, decoding it again now if it
+        has been evicted: exporting and sharing need the preview itself
+        rather than a placeholder. '''
+        if slide.restoring:
+            self._pending_restores.pop(slide.uid, None)
+            slide.restored(self._decode_evicted(slide))
+        return slide.preview
+
+    def _decode_evicted(self, slide):
+        ''' Decode an evicted preview again. '''
+        w, h = slide.evicted
+        if slide.mtime is None:
+            return self._preview_cache.get(slide.uid, w, h, EVICTED,
+                                           kind='evicted')
+        try:
+            dsobj = datastore.get(slide.uid)
+        except Exception as e:
+            _logger.error('Could not restore preview for %s: %s' %
+                          (slide.uid, e))
+            return None
+        try:
+            return self._get_preview(dsobj)
+        except Exception as e:
+            _logger.error('Could not restore preview for %s: %s' %
+                          (slide.uid, e))
+            return None
+        finally:
+            dsobj.destroy()
 
     def _rescan_cb(self, button=None):
         ''' Rescan the Journal for changes in starred items. '''
         if self.initiating is not None and not self.initiating:
             return
-        if self.initiating:
-            self._send_event('R', {"data": 'rescanning'})
         self._help.hide()
         self._find_starred()
         self.i = 0
         if self.initiating:
-            self._share_slides()
+            # Tell buddies which slides remain, then send only the
+            # slides that have changed
+            self._send_event('R', {"data": (self._data_dumper(
+                [slide.uid for slide in self._slides
+                 if slide.active and slide.fav]))})
+            self._share_slides(changed_only=True)
         if self._thumbnail_mode:
             self._thumbs_cb()
         else:
@@ -733,17 +1097,62 @@ class PortfolioActivity(activity.Activity):
                                                self._loop)
 
     def _save_as_pdf_cb(self, button=None):
-        ''' Export an PDF version of the slideshow to the Journal. '''
+        ''' Export an PDF version of the slideshow to the Journal. The
+        PDF is written in the background, a page at a time. '''
+        if self._pdf_job is not None:
+            return  # Already saving
         if self.initiating is not None and not self.initiating:
             nick = self._buddies[-1]
         else:
             nick = profile.get_nick_name()
         _logger.debug('saving to PDF...')
         if 'description' in self.metadata:
-            tmp_file = save_pdf(self, nick,
-                                description=self.metadata['description'])
+            description = self.metadata['description']
+            pdf_nick = nick
         else:
-            tmp_file = save_pdf(self, profile.get_nick_name())
+            description = None
+            pdf_nick = profile.get_nick_name()
+        self._pdf_job = PDFJob(self, pdf_nick, description,
+                               progress_cb=self._pdf_progress_cb,
+                               done_cb=self._pdf_done_cb,
+                               quality=self._pdf_quality,
+                               encoder=self._encoder)
+
+        self._pdf_alert = Alert()
+        self._pdf_alert.props.title = _('Saving as PDF')
+        self._pdf_alert.props.msg = ''
+        self._pdf_alert.add_button(Gtk.ResponseType.CANCEL, _('Cancel'),
+                                   Icon(icon_name='dialog-cancel'))
+        self._pdf_alert.connect('response', self._pdf_alert_response_cb)
+        self.add_alert(self._pdf_alert)
+        self._pdf_alert.show()
+
+        self._pdf_nick = nick
+        self._pdf_job.start()
+
+    def get_export_slides(self):
+        ''' The slides to export, in the order they are shown '''
+        return [slide for slide in self._slides
+                if slide.active and slide.fav]
+
+    def _pdf_alert_response_cb(self, alert, response_id):
+        if self._pdf_job is not None:
+            self._pdf_job.cancel()
+
+    def _pdf_progress_cb(self, page, pages):
+        if self._pdf_alert is not None:
+            self._pdf_alert.props.msg = _('Page %(page)d of %(pages)d') % \
+                {'page': page, 'pages': pages}
+
+    def _pdf_done_cb(self, tmp_file):
+        ''' The PDF has been written (or the export was cancelled). '''
+        self._pdf_job = None
+        if self._pdf_alert is not None:
+            self.remove_alert(self._pdf_alert)
+            self._pdf_alert = None
+        if tmp_file is None:
+            return
+        nick = self._pdf_nick
 
         dsobject = datastore.create()
         dsobject.metadata['title'] = '%s %s' % (nick, _('Portfolio'))
@@ -757,7 +1166,7 @@ class PortfolioActivity(activity.Activity):
 
     def _clear_screen(self):
         ''' Clear the screen to the darker of the two XO colors. '''
-        for slide in self._slides:
+        for slide in self._thumbed:
             slide.hide()
         self._title.hide()
         self._preview.hide()
@@ -818,25 +1227,12 @@ class PortfolioActivity(activity.Activity):
         self._prev.set_layer(DRAG)
         self._next.set_layer(DRAG)
 
-        pixbuf = slide.preview
-
-        if pixbuf is not None:
-            self._preview.set_shape(pixbuf.scale_simple(
-                int(PREVIEW[self._orientation][2] * self._scale),
-                int(PREVIEW[self._orientation][3] * self._scale),
-                GdkPixbuf.InterpType.NEAREST))
-            self._preview.set_layer(MIDDLE)
-        else:
-            if self._preview is not None:
-                self._preview.hide()
+        self._show_preview(slide)
 
         self._title.set_label(slide.title)
         self._title.set_layer(MIDDLE)
 
-        if len(slide.description) == 0:
-            self._description.set_label(_('This project is about...'))
-        else:
-            self._description.set_label(slide.description)
+        self._description.set_label(self._description_label(slide))
         self._description.set_layer(MIDDLE)
 
         self._comment.set_label(parse_comments(slide.comment))
@@ -845,8 +1241,7 @@ class PortfolioActivity(activity.Activity):
         self._new_comment.set_layer(MIDDLE)
 
         if self.initiating is None or self.initiating:
-            if slide.sound is None:
-                slide.sound = self._search_for_audio_note(slide.uid)
+            self._find_audio_note(slide)
             if slide.sound is not None:
                 if self._playing:
                     _logger.debug('Playing audio note')
@@ -863,6 +1258,95 @@ class PortfolioActivity(activity.Activity):
             self._record_button.hide()
             self._playback_button.hide()
 
+        self._prefetch_slides(direction)
+
+    def _description_label(self, slide):
+        if len(slide.description) == 0:
+            return _('This project is about...')
+        return slide.description
+
+    def _find_audio_note(self, slide):
+        if not slide.sound_searched:
+            slide.sound = self._search_for_audio_note(slide.uid)
+            slide.sound_searched = True
+
+    def _show_preview(self, slide):
+        ''' Display the preview image of a slide, if it has one yet. '''
+        pixbuf = self._scale_preview(slide)
+
+        if pixbuf is not None:
+            self._preview.set_shape(pixbuf)
+            self._preview.set_layer(MIDDLE)
+        else:
+            if self._preview is not None:
+                self._preview.hide()
+
+    def _scale_preview(self, slide):
+        ''' Return the preview of a slide scaled for display, scaling it
+        only if it has not been prefetched. '''
+        if not slide.has_preview:
+            return None
+        w = int(PREVIEW[self._orientation][2] * self._scale)
+        h = int(PREVIEW[self._orientation][3] * self._scale)
+        if slide.restoring:
+            # A placeholder, shown until the preview is decoded again
+            return slide.preview.scale_simple(
+                w, h, GdkPixbuf.InterpType.NEAREST)
+        scaled = self._scaled_previews.get(slide)
+        if scaled is None or scaled[:3] != (slide.preview_version, w, h):
+            scaled = (slide.preview_version, w, h, slide.preview.scale_simple(
+                w, h, GdkPixbuf.InterpType.NEAREST))
+            self._scaled_previews[slide] = scaled
+        return scaled[3]
+
+    def _neighbour(self, direction):
+        ''' Return the slide that would be shown after the current one
+        when moving in direction, wrapping at the ends as _show_slide
+        does, or None. '''
+        i = self.i + direction
+        while True:
+            i %= len(self._slides)
+            if i == self.i:
+                return None
+            slide = self._slides[i]
+            if slide.active and slide.fav:
+                return slide
+            i += direction
+
+    def _prefetch_slides(self, direction):
+        ''' While a slide is on display, prepare the next slide in the
+        direction we are moving and then the one behind us. '''
+        ahead = self._neighbour(direction)
+        behind = self._neighbour(-direction)
+        self._prefetch_queue = [slide for slide in (ahead, behind)
+                                if slide is not None]
+        # Keep the previews of these slides in memory, and only keep
+        # scaled previews that may be shown next
+        keep = [self._slides[self.i]] + self._prefetch_queue
+        self._preview_budget.pin(keep)
+        for slide in self._scaled_previews.keys():
+            if slide not in keep:
+                del self._scaled_previews[slide]
+        if self._prefetch_id is None and len(self._prefetch_queue) > 0:
+            self._prefetch_id = GObject.idle_add(self._prefetch_cb)
+
+    def _prefetch_cb(self):
+        ''' Prepare one slide per idle call. '''
+        if self._thumbnail_mode or len(self._prefetch_queue) == 0:
+            self._prefetch_id = None
+            return False
+        slide = self._prefetch_queue.pop(0)
+        self._scale_preview(slide)
+        self._title.prepare_label(slide.title)
+        self._description.prepare_label(self._description_label(slide))
+        self._comment.prepare_label(parse_comments(slide.comment))
+        if self.initiating is None or self.initiating:
+            self._find_audio_note(slide)
+        if len(self._prefetch_queue) == 0:
+            self._prefetch_id = None
+            return False
+        return True
+
     def _slides_cb(self, button=None):
         if self._thumbnail_mode:
             self._thumbnail_mode = False
@@ -879,13 +1363,6 @@ class PortfolioActivity(activity.Activity):
         self._show_thumbs()
         return False
 
-    def _count_active(self):
-        count = 0
-        for slide in self._slides:
-            if slide.active:
-                count += 1
-        return count
-
     def _show_thumbs(self):
         self._stop_autoplay()
         self._current_slide = self.i
@@ -896,25 +1373,88 @@ class PortfolioActivity(activity.Activity):
         self._prev.hide()
         self._next.hide()
 
-        n = int(ceil(sqrt(self._count_active())))
+        self._index_thumbs()
+        n = min(int(ceil(sqrt(len(self._thumb_cells)))), MAX_THUMB_COLUMNS)
         if n > 0:
             w = int(self._width / n)
         else:
+            n = 1
             w = self._width
         h = int(w * 0.75)  # maintain 4:3 aspect ratio
         x_off = int((self._width - n * w) / 2)
-        x = x_off
-        y = 0
-        for slide in self._slides:
-            if not slide.active:
-                continue
-            self._show_thumb(slide, x, y, w, h)
-            x += w
-            if x + w > self._width:
-                x = x_off
-                y += h
+        rows = int(ceil(float(self._height) / h))  # including a partial row
+        self._thumb_geometry = (n, rows, w, h, x_off)
+        self._scroll_thumbs(0)
+        self._layout_thumbs()
         self.i = 0  # Reset position in slideshow to the beginning
 
+    def _index_thumbs(self):
+        ''' Give each active slide a thumbnail cell, in slide order. '''
+        self._thumb_cells = [slide for slide in self._slides if slide.active]
+        self._thumb_cell = dict((slide, k)
+                                for k, slide in enumerate(self._thumb_cells))
+
+    def _scroll_thumbs(self, rows):
+        ''' Scroll the thumbnail view by some rows. Returns True if the
+        view has moved. '''
+        n, visible, w, h, x_off = self._thumb_geometry
+        total = int(ceil(float(len(self._thumb_cells)) / n))
+        last = max(0, total - max(1, int(self._height / h)))
+        top = min(max(self._thumb_top_row + rows, 0), last)
+        if top == self._thumb_top_row:
+            return False
+        if self._press is not None:
+            # The dragged thumbnail returns to its cell, which has moved
+            self._startpos = [self._startpos[0],
+                              self._startpos[1] -
+                              (top - self._thumb_top_row) * h]
+        self._thumb_top_row = top
+        return True
+
+    def _dragged_slide(self):
+        ''' The slide whose thumbnail is being dragged, if any '''
+        if not self._thumbnail_mode:
+            return None
+        return self._thumb_to_slide(self._press)
+
+    def _thumb_window(self):
+        ''' The range of cells that should have thumbnail sprites '''
+        n, visible, w, h, x_off = self._thumb_geometry
+        first = max(0, self._thumb_top_row - THUMB_MARGIN_ROWS) * n
+        last = (self._thumb_top_row + visible + THUMB_MARGIN_ROWS) * n
+        return first, min(last, len(self._thumb_cells))
+
+    def _layout_thumbs(self):
+        ''' Show the thumbnails in or near the visible rows, and recycle
+        the sprites of any others. '''
+        first, last = self._thumb_window()
+        # The dragged thumbnail stays under the pointer
+        dragged = self._dragged_slide()
+        for slide in list(self._thumbed):
+            k = self._thumb_cell.get(slide)
+            if slide is not dragged and (k is None or k < first or
+                                         k >= last):
+                self._release_thumb(slide)
+        for k in range(first, last):
+            if self._thumb_cells[k] is not dragged:
+                self._place_thumb(self._thumb_cells[k])
+        if dragged is not None:
+            dragged.thumb.set_layer(DRAG)
+            dragged.star.set_layer(DRAG + 1)
+
+    def _place_thumb(self, slide):
+        ''' Show the thumbnail of a slide in its cell, if that cell is
+        in or near the visible rows. '''
+        first, last = self._thumb_window()
+        k = self._thumb_cell.get(slide)
+        if k is None or k < first or k >= last:
+            self._release_thumb(slide)
+            return
+        n, visible, w, h, x_off = self._thumb_geometry
+        x = x_off + (k % n) * w
+        y = (int(k / n) - self._thumb_top_row) * h
+        self._show_thumb(slide, x, y, w, h)
+
     def _show_thumb(self, slide, x, y, w, h):
         ''' Display a preview image and title as a thumbnail. '''
 
@@ -924,19 +1464,34 @@ class PortfolioActivity(activity.Activity):
             if sw == w and sh == h:
                 slide.thumb.move((x, y))
             else:
-                slide.thumb.hide()
-                slide.thumb = None
+                self._release_thumb(slide)
         if slide.thumb is None:
-            if slide.preview is not None:
-                pixbuf_thumb = slide.preview.scale_simple(
-                    int(w), int(h), GdkPixbuf.InterpType.TILES)
+            if slide.has_preview:
+                # Don't trust the cache while a newer preview is pending
+                if slide.uid in self._pending_previews:
+                    mtime = None
+                else:
+                    mtime = slide.mtime
+                pixbuf_thumb = self._preview_cache.get(
+                    slide.uid, w, h, mtime, kind='thumb')
+                if pixbuf_thumb is None:
+                    pixbuf_thumb = slide.preview.scale_simple(
+                        int(w), int(h), GdkPixbuf.InterpType.TILES)
+                    if not slide.restoring:
+                        self._preview_cache.put(slide.uid, w, h, mtime,
+                                                pixbuf_thumb, kind='thumb')
+            else:
+                pixbuf_thumb = blank_surface(int(w), int(h), self._colors)
+            if len(self._thumb_pool) > 0:
+                spr = self._thumb_pool.pop()
+                spr.set_image(pixbuf_thumb)
+                spr.move((x, y))
             else:
-                pixbuf_thumb = svg_str_to_pixbuf(genblank(int(w), int(h),
-                                                          self._colors))
-            slide.thumb = Sprite(self._sprites, x, y, pixbuf_thumb)
+                spr = Sprite(self._sprites, x, y, pixbuf_thumb)
+            self._set_thumb(slide, spr)
             # Add a border
-            slide.thumb.set_image(svg_str_to_pixbuf(
-                svg_rectangle(int(w), int(h), slide.colors)), i=1)
+            slide.thumb.set_image(
+                rectangle_surface(int(w), int(h), slide.colors), i=1)
         slide.thumb.set_layer(TOP)
         if slide.star is None:
             self._make_star(slide)
@@ -950,19 +1505,17 @@ class PortfolioActivity(activity.Activity):
 
     # Handle the draw-event by drawing
     def do_draw_event(self, context):
-
-        allocation = self.get_allocation()
-
-        # Create the cairo context
-        cr = self.canvas.props.window.cairo_create()
-
-        # Restrict Cairo to the drawn area; avoid extra work
-        cr.rectangle(allocation.x, allocation.y,
-                     allocation.width, allocation.height)
-        cr.clip()
+        ''' The context is already clipped to the damaged area: only
+        redraw the sprites that intersect it. '''
+        try:
+            area = context.copy_clip_rectangle_list()
+        except cairo.Error:
+            # The clip cannot be represented as rectangles
+            x1, y1, x2, y2 = context.clip_extents()
+            area = [(x1, y1, x2 - x1, y2 - y1)]
 
         # Refresh sprite list
-        self._sprites.redraw_sprites(cr=cr)
+        self._sprites.redraw_sprites(area=area, cr=context)
 
     def write_file(self, file_path):
         ''' Clean up '''
@@ -971,6 +1524,8 @@ class PortfolioActivity(activity.Activity):
             return
 
         self._save_changes_cb()
+        self._journal_writer.flush()
+        self._preview_cache.sync()
         if os.path.exists(os.path.join(self.datapath, 'output.ogg')):
             os.remove(os.path.join(self.datapath, 'output.ogg'))
 
@@ -1122,6 +1677,7 @@ class PortfolioActivity(activity.Activity):
             spr.type = 'unstar'
             slide = self._star_to_slide(spr)
             slide.fav = False
+            slide.shared_hash = None
             if self.initiating:
                 self._send_star(slide.uid, False)
         elif spr.type == 'unstar':
@@ -1189,19 +1745,22 @@ class PortfolioActivity(activity.Activity):
                 press_slide.star.set_layer(STAR)
             spr = self._sprites.find_sprite((x, y))
             self._press.set_layer(TOP)  # and then restore press to top layer
+            # The drag is over, so the swaps below lay it out again
+            press = self._press
+            self._press = None
 
             if press_slide is not None:
                 self._release = spr
                 # If we found a thumbnail
                 # ...and it is the one we dragged, jump to that slide.
-                if self._press == self._release:
+                if press == self._release:
                     if self._total_drag[0] * self._total_drag[0] + \
                        self._total_drag[1] * self._total_drag[1] < 200:
-                        self.i = self._slides.index(press_slide)
+                        self.i = self._slide_index(press_slide)
                         self._current_slide = self.i
                         self._slide_button.set_active(True)
                     else:  # TODO: test for dragged to beginning
-                        i = self._slides.index(press_slide)
+                        i = self._slide_index(press_slide)
                         n = len(self._slides) - 1
                         press_slide.thumb.move(self._startpos)
                         press_slide.star.move(self._startpos)
@@ -1222,8 +1781,11 @@ class PortfolioActivity(activity.Activity):
                         release_slide = self._thumb_to_slide(self._release)
                     press_slide.thumb.move(self._startpos)
                     press_slide.star.move(self._startpos)
-                    self._swap_slides(self._slides.index(press_slide),
-                                      self._slides.index(release_slide))
+                    self._swap_slides(self._slide_index(press_slide),
+                                      self._slide_index(release_slide))
+                if self._thumbnail_mode:
+                    # Its cell may have been scrolled out of view
+                    self._place_thumb(press_slide)
         self._press = None
         self._release = None
         return False
@@ -1233,16 +1795,33 @@ class PortfolioActivity(activity.Activity):
             self._unselect()
 
     def _swap_slides(self, i, j):
-        ''' Swap order and x, y position of two slides '''
-        tmp = self._slides[i]
-        self._slides[i] = self._slides[j]
-        self._slides[j] = tmp
-        xi, yi = self._slides[i].thumb.get_xy()
-        xj, yj = self._slides[j].thumb.get_xy()
-        self._slides[i].thumb.move((xj, yj))
-        self._slides[i].star.move((xj, yj))
-        self._slides[j].thumb.move((xi, yi))
-        self._slides[j].star.move((xi, yi))
+        ''' Swap order and thumbnail cells of two slides '''
+        slide_i = self._slides[i]
+        slide_j = self._slides[j]
+        self._slides[i] = slide_j
+        self._slides[j] = slide_i
+        self._slide_positions[slide_j] = i
+        self._slide_positions[slide_i] = j
+        if self._thumbnail_mode:
+            # Inactive slides have no cell, so swapping with one moves
+            # the thumbnails in between too
+            self._index_thumbs()
+            self._layout_thumbs()
+
+    def _scroll_cb(self, win, event):
+        ''' Scroll the thumbnail view with the mouse wheel, also while
+        dragging a thumbnail to a slide out of view. '''
+        if not self._thumbnail_mode:
+            return False
+        if event.direction == Gdk.ScrollDirection.UP:
+            rows = -1
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            rows = 1
+        else:
+            return False
+        if self._scroll_thumbs(rows):
+            self._layout_thumbs()
+        return True
 
     def _unit_combo_cb(self, arg=None):
         ''' Read value of predefined conversion factors from combo box '''
@@ -1251,6 +1830,13 @@ class PortfolioActivity(activity.Activity):
             if active in UNIT_DICTIONARY:
                 self._rate = UNIT_DICTIONARY[active][1]
 
+    def _quality_combo_cb(self, arg=None):
+        ''' Read the PDF export quality from the combo box '''
+        if hasattr(self, '_quality_combo'):
+            active = self._quality_combo.get_active()
+            if 0 <= active < len(PDF_QUALITIES):
+                self._pdf_quality = PDF_QUALITIES[active]
+
     def _record_cb(self, button=None):
         ''' Start/stop audio recording '''
         if self.initiating is not None and not self.initiating:
@@ -1340,24 +1926,35 @@ class PortfolioActivity(activity.Activity):
                 dsobject.set_file_path(
                     os.path.join(self.datapath, '%s.ogg' % (slide.uid)))
                 datastore.write(dsobject)
+                self._audio_notes[slide.uid] = dsobject
                 dsobject.destroy()
         else:
             _logger.debug('Nothing to save...')
         return
 
+    def _index_audio_notes(self):
+        ''' Find all the audio notes in the Journal in one query, and
+        index them by the object ids in their tags. '''
+        self._audio_notes = {}
+        if self.initiating is not None and not self.initiating:
+            return
+        dsobjects, nobjects = datastore.find({'mime_type': ['audio/ogg']})
+        for dsobject in dsobjects:
+            if 'tags' not in dsobject.metadata:
+                continue
+            for tag in dsobject.metadata['tags'].replace(',', ' ').split():
+                if tag not in self._audio_notes:
+                    self._audio_notes[tag] = dsobject
+
     def _search_for_audio_note(self, obj_id):
         ''' Look to see if there is already a sound recorded for this
         dsobject '''
         if self.initiating is not None and not self.initiating:
             return
-        dsobjects, nobjects = datastore.find({'mime_type': ['audio/ogg']})
-        # Look for tag that matches the target object id
-        for dsobject in dsobjects:
-            if 'tags' in dsobject.metadata and \
-               obj_id in dsobject.metadata['tags']:
-                _logger.debug('Found audio note')
-                return dsobject
-        return None
+        dsobject = self._audio_notes.get(obj_id)
+        if dsobject is not None:
+            _logger.debug('Found audio note')
+        return dsobject
 
     def _save_changes_cb(self, button=None):
         ''' Find the object in the datastore and write out the changes
@@ -1365,25 +1962,49 @@ class PortfolioActivity(activity.Activity):
         if self.initiating is not None and not self.initiating:
             _logger.debug('skipping write (%s)' % (str(self.initiating)))
             return
+        self._unselect()  # Include the edit in progress
         for slide in self._slides:
+            if slide in self._autosave_ids:
+                GObject.source_remove(self._autosave_ids.pop(slide))
             if not slide.dirty:
                 continue
             _logger.debug('%d is dirty... writing' % (
-                self._slides.index(slide)))
-            jobject = datastore.get(slide.uid)
-            jobject.metadata['description'] = slide.description
-            jobject.metadata['comments'] = json.dumps(slide.comment)
-            jobject.metadata['title'] = slide.title
-            datastore.write(jobject,
-                            update_mtime=False,
-                            reply_handler=self.datastore_write_cb,
-                            error_handler=self.datastore_write_error_cb)
-
-    def datastore_write_cb(self):
-        self._unselect()
-
-    def datastore_write_error_cb(self, error):
+                self._slide_index(slide)))
+            self._write_slide(slide)
+
+    def _slide_metadata(self, slide):
+        ''' The Journal metadata that can be edited in Portfolio '''
+        return {'description': slide.description,
+                'comments': json.dumps(slide.comment),
+                'title': slide.title}
+
+    def _write_slide(self, slide):
+        ''' Queue the edits to a slide to be written to the Journal:
+        only the keys that were edited, so that changes made to the
+        others in the Journal since it was scanned are kept. '''
+        changes = dict((key, value) for key, value
+                       in self._slide_metadata(slide).items()
+                       if slide.saved.get(key) != value)
+        if len(changes) == 0:
+            slide.dirty = False
+            return
+        slide.saved.update(changes)
+        self._journal_writer.write(slide.uid, changes)
+
+    def datastore_write_cb(self, uid, metadata):
+        ''' Everything queued for uid has been written. '''
+        slide = self._uid_to_slide(uid)
+        # The slide may have been edited again since it was queued
+        if slide is not None and \
+           slide.saved == self._slide_metadata(slide):
+            slide.dirty = False
+
+    def datastore_write_error_cb(self, uid, error):
         _logger.error('datastore_write_error_cb: %r' % error)
+        slide = self._uid_to_slide(uid)
+        if slide is not None:
+            # Write everything again next time
+            slide.saved = {}
 
     def _notify_successful_save(self, title='', msg=''):
         ''' Notify user when saves are completed '''
@@ -1420,6 +2041,14 @@ class PortfolioActivity(activity.Activity):
                 self._next_cb()
             elif keyname == 'End':
                 self._last_cb()
+        else:
+            rows = self._thumb_geometry[1] - 1
+            scroll = {'Up': -1, 'Down': 1,
+                      'Page_Up': -rows, 'Page_Down': rows,
+                      'Home': -len(self._thumb_cells),
+                      'End': len(self._thumb_cells)}
+            if keyname in scroll and self._scroll_thumbs(scroll[keyname]):
+                self._layout_thumbs()
         return True
 
     def _unselect(self):
@@ -1458,9 +2087,28 @@ class PortfolioActivity(activity.Activity):
                     self._comment.set_label(parse_comments(slide.comment))
                     self._selected_spr.set_label('')
                     slide.dirty = True
+            if slide.dirty:
+                self._schedule_autosave(slide)
         self._selected_spr = None
         self._saved_string = ''
 
+    def _schedule_autosave(self, slide):
+        ''' Save a slide to the Journal once it has not been edited for
+        AUTOSAVE_DELAY seconds. '''
+        if self.initiating is not None and not self.initiating:
+            return
+        if slide in self._autosave_ids:
+            GObject.source_remove(self._autosave_ids[slide])
+        self._autosave_ids[slide] = GObject.timeout_add_seconds(
+            AUTOSAVE_DELAY, self._autosave_cb, slide)
+
+    def _autosave_cb(self, slide):
+        del self._autosave_ids[slide]
+        if slide.dirty and slide.active:
+            # Merged with any write of this slide still queued
+            self._write_slide(slide)
+        return False
+
     def _restore_cursor(self):
         ''' No longer waiting, so restore standard cursor. '''
         if not hasattr(self, 'get_window'):
@@ -1479,46 +2127,113 @@ class PortfolioActivity(activity.Activity):
     def _dump(self, slide):
         ''' Dump data for sharing.'''
         _logger.debug('dumping %s' % (slide.uid))
-        if slide.preview is None:
+        if not slide.has_preview:
             data = [slide.uid, slide.title, None, slide.description,
                     slide.comment]
         else:
-            data = [slide.uid, slide.title,
-                    pixbuf_to_base64(activity, slide.preview,
-                                     width=300, height=225),
-                    slide.description, slide.comment]
+            png = self._preview_to_png(slide)
+            if png is not None:
+                png = b64encode(png)
+            data = [slide.uid, slide.title, png, slide.description,
+                    slide.comment]
         return self._data_dumper(data)
 
+    def _dump_metadata(self, slide):
+        ''' Dump everything but the preview, which is sent as a file
+        transfer. '''
+        return self._data_dumper([slide.uid, slide.title,
+                                  self._preview_to_png(slide) is not None,
+                                  slide.description, slide.comment,
+                                  self._slide_hash(slide)])
+
+    def _slide_hash(self, slide):
+        ''' Hash everything that is shared about a slide, so that buddies
+        can tell which slides they already have. '''
+        content = hashlib.sha1()
+        content.update(self._data_dumper(
+            [SYNC_VERSION, slide.title, slide.description, slide.comment]))
+        png = self._preview_to_png(slide)
+        if png is not None:
+            content.update(png)
+        return content.hexdigest()
+
+    def _preview_to_png(self, slide):
+        ''' Return the PNG-encoded preview of a slide, only encoding it
+        if the preview has changed since it was last encoded. '''
+        if not slide.has_preview:
+            return None
+        if not self._preview_encoded(slide):
+            slide.encoded_preview = (
+                slide.preview_version,
+                pixbuf_to_png(self.load_preview(slide), 300, 225))
+        return slide.encoded_preview[1]
+
+    def _preview_encoded(self, slide):
+        return not slide.has_preview or \
+            (slide.encoded_preview is not None and
+             slide.encoded_preview[0] == slide.preview_version)
+
     def _data_dumper(self, data):
         return json.dumps(data)
 
     def _load(self, data):
-        ''' Load slide data from a sharer. '''
-        self._restore_cursor()
+        ''' Load slide data, including a base64-encoded preview, from a
+        sharer. '''
         uid, title, base64, description, comment = self._data_loader(data)
+        if base64 is None:
+            preview = None
+        else:
+            preview = base64_to_pixbuf(activity, base64)
+        self._update_slide(uid, title, description, comment, preview)
+
+    def _load_metadata(self, data):
+        ''' Load slide data from a sharer. The preview is sent separately
+        as a file transfer and may arrive before or after the metadata. '''
+        uid, title, has_preview, description, comment, content_hash = \
+            self._data_loader(data)
+        slide = self._uid_to_slide(uid)
+        if slide is not None and slide.active and \
+           slide.hash == content_hash:
+            _logger.debug('already have %s' % (uid))
+            return
+        if not has_preview:
+            self._update_slide(uid, title, description, comment, None)
+        elif uid in self._received_previews:
+            self._update_slide(uid, title, description, comment,
+                               self._received_previews.pop(uid))
+        else:
+            self._update_slide(uid, title, description, comment,
+                               update_preview=False)
+        self._uid_to_slide(uid).hash = content_hash
+
+    def _update_slide(self, uid, title, description, comment, preview=None,
+                      update_preview=True):
+        ''' Add or update a slide received from a sharer. '''
+        self._restore_cursor()
         if self._uid_to_slide(uid) is None:
             _logger.debug('loading %s' % (uid))
-            if base64 is None:
-                preview = None
-            else:
-                preview = base64_to_pixbuf(activity, base64)
-            self._slides.append(Slide(self._buddies[-1],
-                                      uid,
-                                      self._colors,
-                                      title,
-                                      preview,
-                                      description,
-                                      comment))
+            self._add_slide(Slide(self._buddies[-1],
+                                  uid,
+                                  self._colors,
+                                  title,
+                                  preview,
+                                  description,
+                                  comment,
+                                  self._preview_budget))
+            self._nobjects += 1
         else:
             _logger.debug('updating description for %s' % (uid))
             slide = self._uid_to_slide(uid)
             slide.title = title
-            if base64 is None:
-                slide.preview = None
-            else:
-                slide.preview = base64_to_pixbuf(activity, base64)
+            if update_preview:
+                slide.preview = preview
+                self._release_thumb(slide)
             slide.description = description
             slide.comment = comment
+            # This may be an update of a slide we already have (e.g. its
+            # preview has finished decoding on the sharer)
+            if not slide.active:
+                self._nobjects += 1
             slide.active = True
             if not slide.fav:
                 slide.fav = True
@@ -1526,13 +2241,47 @@ class PortfolioActivity(activity.Activity):
                     slide.star.set_shape(self._fav_pixbuf)
                     slide.star.type = 'star'
 
-        self._nobjects += 1
-
         if not self._thumbnail_mode:
             self._thumb_button.set_active(True)
         else:
             self._show_thumbs()
 
+    def _incoming_file_cb(self, collab, transfer, description):
+        ''' A buddy is sending us a slide preview, an event meant for us
+        alone, or both. '''
+        if not isinstance(description, dict):
+            return
+        if 'command' in description:
+            self.event_received_cb(collab, None, description)
+            if 'uid' not in description:
+                transfer.cancel()  # There is nothing else to receive
+                return
+        if 'uid' not in description:
+            return
+        transfer.connect('notify::state', self._preview_transfer_state_cb,
+                         description['uid'])
+        transfer.accept_to_memory()
+
+    def _preview_transfer_state_cb(self, transfer, pspec, uid):
+        if transfer.props.state != FT_STATE_COMPLETED:
+            return
+        stream = transfer.props.output
+        stream.close(None)
+        try:
+            preview = data_to_pixbuf(stream.steal_as_bytes().get_data(),
+                                     300, 225)
+        except Exception as e:
+            _logger.error('Could not load preview for %s: %s' % (uid, e))
+            return
+        slide = self._uid_to_slide(uid)
+        if slide is None:
+            # The metadata has not arrived yet
+            self._received_previews[uid] = preview
+            return
+        _logger.debug('received preview for %s' % (uid))
+        slide.preview = preview
+        self._preview_ready(slide)
+
     def _data_loader(self, data):
         return json.loads(data)
 
@@ -1627,18 +2376,27 @@ class PortfolioActivity(activity.Activity):
                 self.tubes_chan[
                     telepathy.CHANNEL_TYPE_TUBES].AcceptDBusTube(id)
 
-            self.collab = CollabWrapper(self)
-            self.collab.message.connect(self.event_received_cb)
-            self.collab.setup()
+            self._setup_collab(CollabWrapper(self))
 
             if self.waiting:
-                self._share_nick()
+                self._request_sync()
+
+    def _setup_collab(self, collab):
+        ''' Start using a collaboration channel: a CollabWrapper, or a
+        loopback.LoopbackCollab when testing without Telepathy. '''
+        self.collab = collab
+        self.collab.message.connect(self.event_received_cb)
+        self.collab.incoming_file.connect(self._incoming_file_cb)
+        self.collab.buddy_joined.connect(self._buddy_joined_cb)
+        self.collab.buddy_left.connect(self._buddy_left_cb)
+        self.collab.setup()
 
     def event_received_cb(self, collab, buddy, msg):
         ''' Data is passed as tuples: cmd:text '''
         command = msg.get("command")
-        payload = msg.get("payload")
+        payload = msg.get("data", msg.get("payload"))
         dispatch_table = {'s': self._load,
+                          'm': self._load_metadata,
                           'C': self._update_colors,
                           'd': self._update_description,
                           'c': self._update_comment,
@@ -1648,11 +2406,37 @@ class PortfolioActivity(activity.Activity):
                           'j': self._new_join,
                           }
         _logger.debug('<<< %s' % command)
-        dispatch_table[command](payload)
+        if command == 'h':
+            # Sync requests are answered directly to the sender
+            self._sync_request(payload, buddy)
+        elif command in dispatch_table:
+            dispatch_table[command](payload)
+        else:
+            _logger.debug('ignoring unknown command %s' % command)
+
+    def _buddy_joined_cb(self, collab, buddy):
+        if buddy not in self._collab_buddies:
+            self._collab_buddies.append(buddy)
+
+    def _buddy_left_cb(self, collab, buddy):
+        if buddy in self._collab_buddies:
+            self._collab_buddies.remove(buddy)
 
     def _reset(self, data):
+        ''' The sharer rescanned its Journal: drop the slides it no
+        longer has (or all of them, if it did not say which remain), and
+        bring back those it has again. '''
+        try:
+            remaining = set(self._data_loader(data))
+        except (TypeError, ValueError):
+            remaining = set()
+        self._nobjects = 0
         for slide in self._slides:
-            slide.active = False
+            slide.active = slide.uid in remaining
+            if slide.active:
+                self._nobjects += 1
+        if self._thumbnail_mode:
+            self._show_thumbs()
 
     def _new_join(self, data):
         if data not in self._buddies:
@@ -1662,6 +2446,23 @@ class PortfolioActivity(activity.Activity):
             self._share_colors()
             self._share_slides()
 
+    def _sync_request(self, data, buddy):
+        ''' A buddy joined and told us which slides (and which versions
+        of them) it already has: send it only what is missing. '''
+        request = self._data_loader(data)
+        if request['nick'] not in self._buddies:
+            self._buddies.append(request['nick'])
+        if not self.initiating:
+            return
+        self._share_nick(buddy)
+        self._share_colors(buddy)
+        have = request['slides']
+        for slide in self._slides:
+            if slide.active and slide.fav and \
+               slide.uid not in self._pending_previews:
+                self._share_slide(slide, buddy=buddy,
+                                  known_hash=have.get(slide.uid))
+
     def _update_star(self, data):
         uid, status = self._data_loader(data)
         slide = self._uid_to_slide(uid)
@@ -1681,18 +2482,17 @@ class PortfolioActivity(activity.Activity):
         colors = self._data_loader(data)
         colors[0] = str(colors[0])
         colors[1] = str(colors[1])
-        self._my_canvas.set_image(svg_str_to_pixbuf(
-            genblank(self._width, self._height, [colors[0], colors[0]])))
+        self._my_canvas.set_image(
+            blank_surface(self._width, self._height, [colors[0], colors[0]]))
         self._title.set_image(
-            svg_str_to_pixbuf(genblank(
-                int(self._title_wh[0]), int(self._title_wh[1]), colors)))
+            blank_surface(int(self._title_wh[0]), int(self._title_wh[1]),
+                          colors))
         self._description.set_image(
-            svg_str_to_pixbuf(genblank(
-                int(self._desc_wh[0]), int(self._desc_wh[1]), colors)))
+            blank_surface(int(self._desc_wh[0]), int(self._desc_wh[1]),
+                          colors))
         self._comment.set_image(
-            svg_str_to_pixbuf(genblank(
-                int(self._comment_wh[0]), int(self._comment_wh[1]),
-                colors)))
+            blank_surface(int(self._comment_wh[0]), int(self._comment_wh[1]),
+                          colors))
         # Don't update new_comment colors
 
     def _update_comment(self, data):
@@ -1703,7 +2503,7 @@ class PortfolioActivity(activity.Activity):
             return
         _logger.debug('updating comment %s' % (uid))
         slide.comment = comment
-        if self.i == self._slides.index(slide):
+        if self.i == self._slide_index(slide):
             self._comment.set_label(parse_comments(slide.comment))
         if self.initiating:
             slide.dirty = True
@@ -1716,7 +2516,7 @@ class PortfolioActivity(activity.Activity):
             return
         _logger.debug('updating title %s' % (uid))
         slide.title = text
-        if self.i == self._slides.index(slide):
+        if self.i == self._slide_index(slide):
             self._title.set_label(text)
         if self.initiating:
             slide.dirty = True
@@ -1729,59 +2529,177 @@ class PortfolioActivity(activity.Activity):
             return
         _logger.debug('updating title %s' % (uid))
         slide.description = text
-        if self.i == self._slides.index(slide):
+        if self.i == self._slide_index(slide):
             self._description.set_label(text)
         if self.initiating:
             slide.dirty = True
 
-    def _share_nick(self):
+    def _share_nick(self, buddy=None):
         _logger.debug('sharing nick')
-        self._send_event('j', {"data": (profile.get_nick_name())})
+        self._send_event('j', {"data": (profile.get_nick_name())}, buddy)
 
-    def _share_colors(self):
+    def _request_sync(self):
+        ''' Join: ask the sharer for the slides we don't have yet. '''
+        _logger.debug('requesting slides')
+        have = {}
+        for slide in self._slides:
+            if slide.hash is not None:
+                have[slide.uid] = slide.hash
+        self._send_event('h', {"data": (self._data_dumper(
+            {'nick': profile.get_nick_name(), 'slides': have}))})
+
+    def _share_colors(self, buddy=None):
         _logger.debug('sharing colors')
-        self._send_event('C', {"data": (self._data_dumper(self._colors))})
+        self._send_event('C', {"data": (self._data_dumper(self._colors))},
+                         buddy)
 
-    def _share_slides(self):
+    def _share_slides(self, changed_only=False):
         for slide in self._slides:
-            if slide.active and slide.fav:
-                _logger.debug('sharing %s' % (slide.uid))
-                GObject.idle_add(self._send_event, 's', {"data": (
-                    str(self._dump(slide)))})
+            # Slides still being decoded are shared once they are ready
+            if slide.active and slide.fav and \
+               slide.uid not in self._pending_previews:
+                self._share_slide(slide, changed_only=changed_only)
+
+    def _share_slide(self, slide, buddy=None, changed_only=False,
+                     known_hash=None):
+        ''' Queue a slide to be sent once its preview is encoded. The
+        encoding is done by worker threads; slides are sent in order.
+        The slide is sent to buddy (or to everyone), and skipped if its
+        hash matches known_hash or, with changed_only, the hash last
+        sent to everyone. '''
+        _logger.debug('sharing %s' % (slide.uid))
+        self._share_queue.append((slide, buddy, changed_only, known_hash))
+        if not self._preview_encoded(slide):
+            self._encode_preview(slide)
+        self._flush_share_queue()
+
+    def _encode_preview(self, slide):
+        if self._encoding.get(slide) == slide.preview_version:
+            return  # Already being encoded
+        self._encoding[slide] = slide.preview_version
+        self._encoder.encode(self.load_preview(slide), 300, 225,
+                             self._preview_encoded_cb, slide,
+                             slide.preview_version)
+
+    def _preview_encoded_cb(self, pixbuf, data, slide, version):
+        if self._encoding.get(slide) == version:
+            del self._encoding[slide]
+        # If encoding failed, the slide is sent without a preview
+        slide.encoded_preview = (version, data)
+        self._flush_share_queue()
+
+    def _flush_share_queue(self):
+        ''' Send the queued slides that are ready, in order. '''
+        while len(self._share_queue) > 0:
+            slide, buddy, changed_only, known_hash = self._share_queue[0]
+            if not self._preview_encoded(slide):
+                # The preview may have changed since it was queued
+                self._encode_preview(slide)
+                break
+            self._share_queue.popleft()
+            content_hash = self._slide_hash(slide)
+            if changed_only:
+                known_hash = slide.shared_hash
+            if known_hash == content_hash:
+                _logger.debug('%s is up to date' % (slide.uid))
+                continue
+            self._send_slide(slide, buddy)
+            if buddy is None:
+                slide.shared_hash = content_hash
+
+    def _send_slide(self, slide, buddy=None):
+        ''' Send the slide metadata as a text message and the preview as
+        a file transfer to buddy (or to each buddy). Fall back to an
+        inline base64 preview if file transfers are not available. '''
+        if not hasattr(self, 'collab') or self.collab is None:
+            return
+        if not hasattr(self.collab, 'send_file_memory'):
+            self._send_event('s', {"data": (str(self._dump(slide)))})
+            return
+        metadata = {"data": (str(self._dump_metadata(slide)))}
+        png = self._preview_to_png(slide)
+        if buddy is not None:
+            # Only the buddy that asked gets the metadata, in the same
+            # transfer as the preview
+            if png is not None:
+                metadata['uid'] = slide.uid
+            self._send_event('m', metadata, buddy, png)
+            return
+        # Buddies that already have this version ignore the metadata
+        self._send_event('m', metadata)
+        if png is None:
+            return
+        for buddy in self._collab_buddies:
+            self.collab.send_file_memory(buddy, png, {'uid': slide.uid})
 
     def _send_star(self, uid, status):
         _logger.debug('sharing star for %s (%s)' % (uid, str(status)))
         self._send_event('S', {"data": (self._data_dumper([uid, status]))})
 
-    def _send_event(self, command, data):
-        ''' Send event through the tube. '''
+    def _send_event(self, command, data, buddy=None, blob=None):
+        ''' Send event through the tube, or to buddy alone. Text messages
+        go to everyone, so an event for one buddy is sent as the
+        description of a file transfer to it, of blob if there is one. '''
         if hasattr(self, 'collab') and self.collab is not None:
             _logger.debug('>>> %s' % command)
             data["command"] = command
-            self.collab.post(data)
-
-    def _save_as_odp_cb(self, button=None):
-        self._get_image_list()
-
-    def _next_image(self, x, image_list):
-        if x < len(self._slides):
-            self.i = x
-            self._show_slide()
-            window = self._canvas.get_window()
-            pixbuf = Gdk.pixbuf_get_from_window(window, 0, 0,
-                                                Gdk.Screen.width(),
-                                                Gdk.Screen.height())
-
-            pixbuf.savev('/tmp/slide_%d.png' % x, 'png', [], [])
-            image_list.append('/tmp/slide_%d.png' % x)
-            self._next_cb()
-            GObject.idle_add(self._next_image, x + 1, image_list)
+            if buddy is None or \
+               not hasattr(self.collab, 'send_file_memory'):
+                self.collab.post(data)
+            else:
+                self.collab.send_file_memory(buddy, blob or '', data)
+
+    def _save_as_odp_cb(self, button=None, native=True):
+        ''' Export an ODP version of the slideshow to the Journal, a
+        slide per idle call. Slides are written as text frames and their
+        original picture, or if native is False, as pictures of the
+        slides painted off screen. '''
+        if self._odp_id is not None:
+            return  # Already saving
+        pres = TurtleODP()
+        pres.create_presentation(os.path.join(self.datapath, 'Portfolio.odp'),
+                                 1024, 768)
+        if native:
+            renderer = None
         else:
-            pres = TurtleODP()
-            pres.create_presentation('/tmp/Portfolio.odp', 1024, 768)
-            for file_path in image_list:
-                pres.add_image(file_path)
+            renderer = self.get_slide_renderer()
+        # Journal objects, for the pictures of image slides
+        dsobjects = dict((dsobj.object_id, dsobj)
+                         for dsobj in self.dsobjects)
+        self._odp_id = GObject.idle_add(self._next_image, 0,
+                                        self.get_export_slides(), pres,
+                                        renderer, [], dsobjects)
+
+    def get_slide_renderer(self):
+        ''' A renderer for slides laid out as they are on this screen '''
+        rects = {'title': self._title_xy + self._title_wh,
+                 'preview': self._preview_xy + self._preview_wh,
+                 'description': self._desc_xy + self._desc_wh,
+                 'comment': self._comment_xy + self._comment_wh}
+        return SlideRenderer(self._width, self._height, self._colors, rects,
+                             self.title_size, self.desc_size)
+
+    def _next_image(self, x, slides, pres, renderer, image_list,
+                    dsobjects):
+        if x < len(slides):
+            try:
+                if renderer is None:
+                    self._add_odp_slide(pres, slides[x], dsobjects)
+                else:
+                    path = os.path.join(self.datapath, 'slide_%d.png' % x)
+                    self.load_preview(slides[x])
+                    renderer.render(slides[x]).write_to_png(path)
+                    image_list.append(path)
+                    pres.add_image(path)
+            except Exception:
+                self._odp_id = None
+                raise
+            self._odp_id = GObject.idle_add(self._next_image, x + 1, slides,
+                                            pres, renderer, image_list,
+                                            dsobjects)
+            return False
 
+        try:
             pres.save_presentation()
             dsobject = datastore.create()
             dsobject.metadata['title'] = '%s.odp' % (
@@ -1790,25 +2708,40 @@ class PortfolioActivity(activity.Activity):
                 profile.get_color().to_string()
             dsobject.metadata['mime_type'] = \
                 'application/vnd.oasis.opendocument.presentation'
-            dsobject.set_file_path('/tmp/Portfolio.odp')
+            dsobject.set_file_path(pres.get_output_path())
             datastore.write(dsobject)
             dsobject.destroy()
-            os.remove('/tmp/Portfolio.odp')
-            self.i = 0
-            self._show_slide()
-
-    def _get_image_list(self):
-        image_list = []
-        tmp_dir = os.listdir("/tmp")
-
-        for x in tmp_dir:
-            if x.startswith("slide_"):
-                try:
-                    os.remove("/tmp/" + x)
-                except:
-                    pass
+        finally:
+            for file_path in image_list:
+                os.remove(file_path)
+            if os.path.exists(pres.get_output_path()):
+                os.remove(pres.get_output_path())
+            self._odp_id = None
+        return False
 
-        self._next_image(0, image_list)
+    def _add_odp_slide(self, pres, slide, dsobjects):
+        ''' Add a slide to the presentation as text, with the Journal
+        object itself if it is an image, or else its preview. '''
+        picture = {}
+        dsobj = dsobjects.get(slide.uid)
+        if dsobj is not None:
+            mime_type = dsobj.metadata.get('mime_type', '')
+            if mime_type[0:5] == 'image' and \
+               os.path.exists(dsobj.file_path):
+                picture['picture_path'] = dsobj.file_path
+                picture['mediatype'] = mime_type
+        if slide.has_preview:
+            # Previews keep the aspect ratio of the image
+            preview = self.load_preview(slide)
+            picture['size'] = (preview.get_width(), preview.get_height())
+            if 'picture_path' not in picture:
+                # At its own size: the PNG shared with other buddies is
+                # squeezed to 300x225
+                picture['picture_data'] = pixbuf_to_png(
+                    preview, preview.get_width(), preview.get_height())
+                picture['mediatype'] = 'image/png'
+        pres.add_slide(slide.title, slide.description,
+                       parse_comments(slide.comment), **picture)
 
 
 class ChatTube(ExportedGObject):
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+benchmark_base64.py times the encoding and decoding of a shared slide
+preview, per slide: the old way, through temporary files and the
+base64(1) command, and in memory with pixbuf_to_png and data_to_pixbuf.
+
+Usage:
+        python benchmark_base64.py [image ...]
+
+The images are used as the slides; without any, 20 generated images
+are used.
+'''
+
+import os
+import sys
+import time
+import base64
+import random
+import shutil
+import tempfile
+import subprocess
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf
+
+from utils import pixbuf_to_png, data_to_pixbuf
+
+SLIDES = 20
+IMAGE_SIZE = (560, 420)
+SHARED_SIZE = (300, 225)  # The size previews are shared at
+BLOCK = 4
+
+
+def shell_encode(tmp, pixbuf, width, height):
+    ''' Encode a preview as the activity used to, through a temporary
+    PNG file and base64(1) '''
+    png_file = os.path.join(tmp, 'imagetmp.png')
+    base64_file = os.path.join(tmp, 'base64tmp')
+    pixbuf.scale_simple(width, height,
+                        GdkPixbuf.InterpType.NEAREST).savev(
+                            png_file, 'png', [], [])
+    subprocess.check_call('base64 <' + png_file + ' >' + base64_file,
+                          shell=True)
+    with open(base64_file, 'r') as fd:
+        data = fd.read()
+    os.remove(base64_file)
+    os.remove(png_file)
+    return data
+
+
+def shell_decode(tmp, data, width, height):
+    ''' Decode a preview as the activity used to, through base64(1) and
+    a temporary PNG file '''
+    png_file = os.path.join(tmp, 'imagetmp.png')
+    base64_file = os.path.join(tmp, 'base64tmp')
+    with open(base64_file, 'w') as fd:
+        fd.write(data)
+    subprocess.check_call('base64 -d <' + base64_file + ' >' + png_file,
+                          shell=True)
+    os.remove(base64_file)
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(png_file, width, height)
+    os.remove(png_file)
+    return pixbuf
+
+
+def memory_encode(tmp, pixbuf, width, height):
+    return base64.b64encode(pixbuf_to_png(pixbuf, width, height))
+
+
+def memory_decode(tmp, data, width, height):
+    return data_to_pixbuf(base64.b64decode(data), width, height)
+
+
+def make_pixbuf(seed):
+    ''' An image of small random blocks, which compresses like a photo '''
+    random.seed(seed)
+    w, h = IMAGE_SIZE
+    pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, w, h)
+    for x in range(0, w, BLOCK):
+        for y in range(0, h, BLOCK):
+            pixbuf.new_subpixbuf(x, y, min(BLOCK, w - x),
+                                 min(BLOCK, h - y)).fill(
+                                     random.getrandbits(24) << 8 | 0xff)
+    return pixbuf
+
+
+def time_per_slide(tmp, pixbufs, encode, decode):
+    ''' Return the seconds per slide to encode and to decode '''
+    start = time.time()
+    encoded = [encode(tmp, pixbuf, SHARED_SIZE[0], SHARED_SIZE[1])
+               for pixbuf in pixbufs]
+    middle = time.time()
+    for data in encoded:
+        decode(tmp, data, SHARED_SIZE[0], SHARED_SIZE[1])
+    end = time.time()
+    return (middle - start) / len(pixbufs), (end - middle) / len(pixbufs)
+
+
+def main(paths):
+    if len(paths) > 0:
+        pixbufs = [GdkPixbuf.Pixbuf.new_from_file_at_size(
+            path, IMAGE_SIZE[0], IMAGE_SIZE[1]) for path in paths]
+    else:
+        pixbufs = [make_pixbuf(i) for i in range(SLIDES)]
+    tmp = tempfile.mkdtemp()
+    try:
+        print('%d slides, milliseconds per slide' % (len(pixbufs)))
+        print('%-12s %10s %10s' % ('', 'encode', 'decode'))
+        for name, encode, decode in (
+                ('base64(1)', shell_encode, shell_decode),
+                ('in memory', memory_encode, memory_decode)):
+            encode_time, decode_time = time_per_slide(tmp, pixbufs, encode,
+                                                      decode)
+            print('%-12s %10.2f %10.2f' % (name, encode_time * 1000,
+                                           decode_time * 1000))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
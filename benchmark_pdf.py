@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+benchmark_pdf.py exports the same slides at each PDF quality and
+reports the export time and the size of the file.
+
+Usage:
+        python benchmark_pdf.py [image ...]
+
+The images are used as the slides; without any, 20 generated 1600x1200
+photo-like images are used.
+'''
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+import gi
+gi.require_version('Gdk', '3.0')
+from gi.repository import GdkPixbuf
+import cairo
+
+from exportpdf import PDFJob, PDF_QUALITIES
+from fakedatastore import FakeDSObject
+from sliderenderer import SlideRenderer
+
+SLIDES = 20
+IMAGE_SIZE = (1600, 1200)
+PREVIEW_SIZE = (560, 420)
+# The slide view on a 1200x900 screen
+SCREEN = (1200, 900)
+RECTS = {'title': (55, 10, 1090, 100),
+         'preview': (55, 110, 560, 420),
+         'description': (615, 110, 530, 420),
+         'comment': (55, 640, 1090, 250)}
+COLORS = ['#FF8080', '#FFFFFF']
+
+
+class BenchmarkSlide():
+
+    ''' The parts of a Portfolio slide that the export uses '''
+
+    def __init__(self, uid, file_path):
+        self.uid = uid
+        self.title = os.path.basename(file_path)
+        self.description = 'A slide made from %s' % (file_path)
+        self.comment = [{'from': 'benchmark', 'message': 'Nice!'}]
+        self.has_preview = True
+        self.preview = GdkPixbuf.Pixbuf.new_from_file_at_size(
+            file_path, PREVIEW_SIZE[0], PREVIEW_SIZE[1])
+
+
+class BenchmarkActivity():
+
+    ''' The parts of PortfolioActivity that the export uses '''
+
+    def __init__(self, paths, datapath):
+        self.title_size = 36
+        self.desc_size = 24
+        self.datapath = datapath
+        self.dsobjects = []
+        self._slides = []
+        for i, path in enumerate(paths):
+            uid = 'benchmark-%d' % (i)
+            self.dsobjects.append(FakeDSObject(
+                uid, {'mime_type': 'image/png', 'title': path}, path))
+            self._slides.append(BenchmarkSlide(uid, path))
+
+    def get_export_slides(self):
+        return self._slides
+
+    def load_preview(self, slide):
+        return slide.preview
+
+    def get_slide_renderer(self):
+        return SlideRenderer(SCREEN[0], SCREEN[1], COLORS, RECTS,
+                             self.title_size, self.desc_size)
+
+
+def make_image(path, seed):
+    ''' Write a noisy gradient image, which compresses like a photo. '''
+    random.seed(seed)
+    w, h = IMAGE_SIZE
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, w, h)
+    cr = cairo.Context(surface)
+    gradient = cairo.LinearGradient(0, 0, w, h)
+    gradient.add_color_stop_rgb(0, random.random(), random.random(),
+                                random.random())
+    gradient.add_color_stop_rgb(1, random.random(), random.random(),
+                                random.random())
+    cr.set_source(gradient)
+    cr.paint()
+    for i in range(2000):
+        cr.set_source_rgba(random.random(), random.random(),
+                           random.random(), 0.5)
+        cr.arc(random.random() * w, random.random() * h,
+               random.random() * 40, 0, 6.3)
+        cr.fill()
+    surface.write_to_png(path)
+
+
+def main(paths):
+    datapath = tempfile.mkdtemp()
+    try:
+        if len(paths) == 0:
+            for i in range(SLIDES):
+                path = os.path.join(datapath, 'image-%d.png' % (i))
+                make_image(path, i)
+                paths.append(path)
+        activity = BenchmarkActivity(paths, datapath)
+        print('%d slides' % (len(paths)))
+        print('%-8s %10s %12s' % ('quality', 'seconds', 'bytes'))
+        for quality in PDF_QUALITIES:
+            job = PDFJob(activity, 'benchmark', quality=quality)
+            start = time.time()
+            path = job.run()
+            seconds = time.time() - start
+            print('%-8s %10.2f %12d' % (quality, seconds,
+                                        os.path.getsize(path)))
+            os.remove(path)
+    finally:
+        shutil.rmtree(datapath)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
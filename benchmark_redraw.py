@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+benchmark_redraw.py drags a thumbnail across a 10x10 grid of thumbnails
+and reports the frames per second when redrawing only the damaged area
+(as the canvas draw handler does) and when redrawing every sprite.
+
+Usage:
+        python benchmark_redraw.py [frames]
+'''
+
+import sys
+import time
+
+import cairo
+
+from sprites import Sprites, Sprite
+
+SCREEN = (1200, 900)
+COLUMNS = 10
+ROWS = 10
+FRAMES = 200
+
+
+class DamageWidget():
+
+    ''' Stands in for the canvas, recording the areas queued for
+    drawing '''
+
+    def __init__(self):
+        self.damage = []
+
+    def queue_draw_area(self, x, y, w, h):
+        self.damage.append((x, y, w, h))
+
+
+def surface(w, h, rgb):
+    image = cairo.ImageSurface(cairo.FORMAT_ARGB32, w, h)
+    cr = cairo.Context(image)
+    cr.set_source_rgb(*rgb)
+    cr.paint()
+    return image
+
+
+def setup(widget):
+    sprites = Sprites(widget)
+    background = Sprite(sprites, 0, 0, surface(SCREEN[0], SCREEN[1],
+                                               (0.9, 0.9, 0.9)))
+    background.set_layer(1)
+    w = int(SCREEN[0] / COLUMNS)
+    h = int(SCREEN[1] / ROWS)
+    thumbs = []
+    for row in range(ROWS):
+        for column in range(COLUMNS):
+            spr = Sprite(sprites, column * w, row * h,
+                         surface(w - 4, h - 4, (column / float(COLUMNS),
+                                                row / float(ROWS), 0.5)))
+            spr.set_layer(3)
+            thumbs.append(spr)
+    return sprites, thumbs
+
+
+def run(frames, damaged_only):
+    widget = DamageWidget()
+    sprites, thumbs = setup(widget)
+    target = cairo.ImageSurface(cairo.FORMAT_RGB24, SCREEN[0], SCREEN[1])
+    dragged = thumbs[0]
+    dragged.set_layer(6)
+    # Drag from the top left corner to the bottom right
+    dx = float(SCREEN[0] - dragged.rect[2]) / frames
+    dy = float(SCREEN[1] - dragged.rect[3]) / frames
+    start = time.time()
+    for frame in range(frames):
+        widget.damage = []
+        dragged.move((int(frame * dx), int(frame * dy)))
+        cr = cairo.Context(target)
+        if damaged_only:
+            for x, y, w, h in widget.damage:
+                cr.rectangle(x, y, w, h)
+            cr.clip()
+            sprites.redraw_sprites(area=widget.damage, cr=cr)
+        else:
+            sprites.redraw_sprites(cr=cr)
+        target.flush()
+    return frames / (time.time() - start)
+
+
+def main(frames):
+    print('Dragging across a %dx%d grid, %d frames' % (COLUMNS, ROWS,
+                                                       frames))
+    full = run(frames, False)
+    damaged = run(frames, True)
+    print('full redraw:    %8.1f frames per second' % (full))
+    print('damaged area:   %8.1f frames per second' % (damaged))
+    print('speed up:       %8.1fx' % (damaged / full))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main(FRAMES)
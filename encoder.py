@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from gi.repository import GObject
+
+from utils import pixbuf_to_png
+
+import logging
+_logger = logging.getLogger("portfolio-activity")
+
+GObject.threads_init()
+
+
+def _encode(pixbuf, width, height):
+    ''' Runs in a worker thread: scale and PNG-encode. '''
+    try:
+        return pixbuf_to_png(pixbuf, width, height)
+    except Exception as e:
+        _logger.error('Could not encode preview: %s' % e)
+        return None
+
+
+class PreviewEncoder():
+
+    ''' Encode previews as PNG for sharing in a pool of worker threads.
+    GdkPixbuf releases the interpreter lock while it scales and
+    compresses, so the work runs in parallel and off the main loop; each
+    result is handed back to the main loop with GObject.idle_add. '''
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = max(1, cpu_count())
+        self._workers = workers
+        self._pool = None
+
+    def encode(self, pixbuf, width, height, callback, *args):
+        ''' Queue a pixbuf for encoding. callback(pixbuf, data, *args) is
+        called on the main loop; data is None if encoding failed. '''
+        self.run(_encode, (pixbuf, width, height), self._encoded, callback,
+                 pixbuf, args)
+
+    def _encoded(self, data, callback, pixbuf, args):
+        callback(pixbuf, data, *args)
+
+    def run(self, function, args, callback, *cb_args):
+        ''' Queue other work for the worker threads. function(*args) must
+        not raise; callback(result, *cb_args) is called on the main loop. '''
+        if self._pool is None:
+            self._pool = ThreadPool(self._workers)
+
+        def done_cb(result):
+            GObject.idle_add(self._done, callback, cb_args, result)
+
+        self._pool.apply_async(function, args, callback=done_cb)
+
+    def _done(self, callback, cb_args, result):
+        callback(result, *cb_args)
+        return False
+
+    def close(self):
+        ''' Stop the worker threads, dropping any queued work. '''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
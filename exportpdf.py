@@ -12,20 +12,16 @@
 
 import os.path
 import time
-import json
 
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
+from gi.repository import GObject
 from gi.repository import Pango
 from gi.repository import PangoCairo
 import cairo
 
-from gettext import gettext as _
-
-from utils import get_pixbuf_from_journal, parse_comments
-
 import logging
 _logger = logging.getLogger("portfolio-activity")
 
@@ -35,78 +31,234 @@ PAGE_HEIGHT = 648
 LEFT_MARGIN = 10
 TOP_MARGIN = 20
 
+# Export quality: the resolution images are embedded at (in dots per
+# inch) and their JPEG quality. Page sizes are in points (1/72 inch).
+PDF_QUALITY = {'draft': (72, 60),
+               'normal': (150, 80),
+               'high': (300, 90)}
+PDF_QUALITIES = ['draft', 'normal', 'high']
+
 
 def save_pdf(activity, nick, description=None):
     ''' Output a PDF document from the title, pictures, and descriptions '''
+    return PDFJob(activity, nick, description).run()
 
-    if len(activity.dsobjects) == 0:
-        return None
 
-    head = activity.title_size
-    body = activity.desc_size / 2
-
-    tmp_file = os.path.join(activity.datapath, 'output.pdf')
-    pdf_surface = cairo.PDFSurface(tmp_file, 504, 648)
-
-    fd = Pango.FontDescription('Sans')
-    cr = cairo.Context(pdf_surface)
-    cr.set_source_rgb(0, 0, 0)
-
-    show_text(cr, fd, nick, head, LEFT_MARGIN, TOP_MARGIN)
-    show_text(cr, fd, time.strftime('%x', time.localtime()),
-              body, LEFT_MARGIN, TOP_MARGIN + 3 * head)
-    if description is not None:
-        show_text(cr, fd, description,
-                  body, LEFT_MARGIN, TOP_MARGIN + 4 * head)
-    cr.show_page()
-
-    for i, dsobj in enumerate(activity.dsobjects):
-        if dsobj.metadata['keep'] == '0':
-            continue
-        if 'title' in dsobj.metadata:
-            show_text(cr, fd, dsobj.metadata['title'], head, LEFT_MARGIN,
-                      TOP_MARGIN)
-        else:
-            show_text(cr, fd, _('untitled'), head, LEFT_MARGIN,
-                      TOP_MARGIN)
-
-        w = 0
-        h = 0
-        pixbuf = None
-        if os.path.exists(dsobj.file_path):
-            print dsobj.file_path
+def _image_surface(pixbuf, jpeg_quality):
+    ''' Convert a pixbuf for cairo. Opaque images also carry JPEG
+    data, which cairo embeds in the PDF in place of the raw pixels
+    (if this pycairo can attach it). '''
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, pixbuf.get_width(),
+                                 pixbuf.get_height())
+    cr = cairo.Context(surface)
+    Gdk.cairo_set_source_pixbuf(cr, pixbuf, 0, 0)
+    cr.paint()
+    if hasattr(surface, 'set_mime_data') and not pixbuf.get_has_alpha():
+        try:
+            saved, data = pixbuf.save_to_bufferv(
+                'jpeg', ['quality'], [str(jpeg_quality)])
+            if saved:
+                surface.set_mime_data(cairo.MIME_TYPE_JPEG, data)
+        except Exception as e:
+            _logger.debug('Could not attach JPEG data: %s' % e)
+    return surface
+
+
+def _load_image(preview, file_path, width, height, jpeg_quality):
+    ''' Runs in a worker thread: decode file_path to fit width x height
+    (or use the preview), and convert it for cairo. '''
+    try:
+        pixbuf = preview
+        if file_path is not None:
             try:
-                w = int(PAGE_WIDTH - LEFT_MARGIN * 2)
-                h = int(w * 3 / 4)
                 pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                    dsobj.file_path, w, h)
-            except:
-                try:
-                    w = 300
-                    h = 225
-                    pixbuf = get_pixbuf_from_journal(dsobj, w, h)
-                except:
-                    pass
-
-        if pixbuf is not None:
-            cr.save()
-            Gdk.cairo_set_source_pixbuf(
-                cr, pixbuf, LEFT_MARGIN, TOP_MARGIN + 150)
-            cr.rectangle(LEFT_MARGIN, TOP_MARGIN + 150, w, h)
-            cr.fill()
-            cr.restore()
-
-        text = ''
-        if 'description' in dsobj.metadata:
-            text += dsobj.metadata['description']
-        if 'comments' in dsobj.metadata:
-            text += '\n'
-            text += parse_comments(json.loads(dsobj.metadata['comments']))
-        show_text(cr, fd, text, body, LEFT_MARGIN, h + 175)
-
-        cr.show_page()
-
-    return tmp_file
+                    file_path, width, height)
+            except Exception as e:
+                _logger.debug('Could not load %s: %s' % (file_path, e))
+        if pixbuf is None:
+            return None
+        return _image_surface(pixbuf, jpeg_quality)
+    except Exception as e:
+        _logger.error('Could not prepare image: %s' % e)
+        return None
+
+
+class PDFJob():
+
+    ''' Write the slides, in their current order, to a PDF one page at
+    a time. With start(), each slide's image is decoded and encoded by
+    the worker threads of encoder (an encoder.PreviewEncoder), and only
+    the page itself is written on the main loop, so that the activity
+    stays responsive; progress_cb(page, pages) is called after each page
+    and done_cb(path) at the end, with path None if there was nothing
+    to save or the job was cancelled. Each page's image is released once
+    the page is written. '''
+
+    def __init__(self, activity, nick, description=None, progress_cb=None,
+                 done_cb=None, quality='normal', encoder=None):
+        self._dpi, self._jpeg_quality = PDF_QUALITY[quality]
+        self._nick = nick
+        self._description = description
+        self._progress_cb = progress_cb
+        self._done_cb = done_cb
+        self._encoder = encoder
+        self._head = activity.title_size
+        self._body = activity.desc_size / 2
+        self._path = os.path.join(activity.datapath, 'output.pdf')
+        self._slides = activity.get_export_slides()
+        self._renderer = activity.get_slide_renderer()
+        self._load_preview = activity.load_preview
+        # Slides are painted at this scale, to fit the page
+        self._scale = min(
+            float(PAGE_WIDTH - 2 * LEFT_MARGIN) / self._renderer.width,
+            float(PAGE_HEIGHT - 2 * TOP_MARGIN) / self._renderer.height)
+        # Journal objects, for images that need more detail than the
+        # slide previews have
+        self._dsobjects = dict((dsobj.object_id, dsobj)
+                               for dsobj in activity.dsobjects)
+        self._empty = len(self._slides) == 0
+        self._surface = None
+        self._cr = None
+        self._fd = Pango.FontDescription('Sans')
+        self._page = 0
+        self._running = False
+
+    @property
+    def pages(self):
+        ''' The number of pages, including the title page '''
+        return len(self._slides) + 1
+
+    def start(self):
+        ''' Write the PDF in the background. '''
+        if self._empty:
+            GObject.idle_add(self._finish, False)
+            return
+        self._open()
+        self._running = True
+        self._write_page()
+        self._progress()
+        self._load_next()
+
+    def run(self):
+        ''' Write the PDF now and return its path. '''
+        if self._empty:
+            return None
+        self._open()
+        while self._write_page(self._load_now()):
+            pass
+        return self._close()
+
+    def cancel(self):
+        if self._running:
+            self._running = False
+            self._finish(False)
+
+    def _open(self):
+        self._surface = cairo.PDFSurface(self._path, PAGE_WIDTH, PAGE_HEIGHT)
+        self._cr = cairo.Context(self._surface)
+        self._cr.set_source_rgb(0, 0, 0)
+        self._page = 0
+
+    def _close(self):
+        self._cr = None
+        self._surface.finish()
+        self._surface = None
+        return self._path
+
+    def _image_args(self):
+        ''' The arguments of _load_image for the next page '''
+        slide = self._slides[self._page - 1]
+        x, y, w, h = self._renderer.get_rect('preview')
+        # The size of the image in pixels at the export resolution
+        w = int(w * self._scale * self._dpi / 72.)
+        h = int(h * self._scale * self._dpi / 72.)
+        return (self._load_preview(slide), self._image_path(slide, w, h),
+                w, h, self._jpeg_quality)
+
+    def _image_path(self, slide, w, h):
+        ''' The file to decode the image of a slide from, if the preview
+        has less detail than the export resolution and the Journal
+        object is an image. '''
+        preview = self._load_preview(slide)
+        if preview is not None and \
+           (preview.get_width() >= w or preview.get_height() >= h):
+            return None
+        dsobj = self._dsobjects.get(slide.uid)
+        if dsobj is not None and \
+           dsobj.metadata.get('mime_type', '')[0:5] == 'image' and \
+           os.path.exists(dsobj.file_path):
+            return dsobj.file_path
+        return None
+
+    def _load_now(self):
+        if self._page == 0:
+            return None
+        return _load_image(*self._image_args())
+
+    def _load_next(self):
+        ''' Prepare the image of the next page in a worker thread. '''
+        self._encoder.run(_load_image, self._image_args(),
+                          self._image_ready_cb)
+
+    def _image_ready_cb(self, image):
+        if not self._running:
+            return  # Cancelled
+        more = self._write_page(image)
+        self._progress()
+        if more:
+            self._load_next()
+        else:
+            self._running = False
+            self._finish(True)
+
+    def _progress(self):
+        if self._progress_cb is not None:
+            self._progress_cb(self._page, self.pages)
+
+    def _finish(self, completed):
+        if completed:
+            path = self._close()
+        else:
+            path = None
+            if self._surface is not None:
+                self._close()
+                os.remove(self._path)
+        if self._done_cb is not None:
+            self._done_cb(path)
+        return False
+
+    def _write_page(self, image=None):
+        ''' Write the next page, with the image prepared for it. Returns
+        True if there are more. '''
+        if self._page == 0:
+            self._write_title_page()
+        else:
+            self._write_slide_page(self._slides[self._page - 1], image)
+        self._cr.show_page()
+        self._page += 1
+        return self._page < self.pages
+
+    def _write_title_page(self):
+        cr = self._cr
+        fd = self._fd
+        head = self._head
+        body = self._body
+        show_text(cr, fd, self._nick, head, LEFT_MARGIN, TOP_MARGIN)
+        show_text(cr, fd, time.strftime('%x', time.localtime()),
+                  body, LEFT_MARGIN, TOP_MARGIN + 3 * head)
+        if self._description is not None:
+            show_text(cr, fd, self._description,
+                      body, LEFT_MARGIN, TOP_MARGIN + 4 * head)
+
+    def _write_slide_page(self, slide, image):
+        ''' Paint the slide as the slide view lays it out, scaled to fit
+        the page. '''
+        cr = self._cr
+        cr.save()
+        cr.translate(LEFT_MARGIN, TOP_MARGIN)
+        cr.scale(self._scale, self._scale)
+        self._renderer.paint(cr, slide, image)
+        cr.restore()
 
 
 def show_text(cr, fd, label, size, x, y):
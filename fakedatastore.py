@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+fakedatastore.py provides an in-memory stand-in for the parts of
+sugar3.datastore.datastore that Portfolio uses, so that Journal writes
+can be exercised without a datastore service.
+
+As with the real datastore, get returns a copy of the object, and
+asynchronous writes are answered from the main loop. Every write is
+recorded in writes, and writes to the object ids in fail are answered
+with an error. gets counts the calls to get, which block on the real
+datastore; get_properties, as the datastore service has, does not.
+
+Example usage:
+        fake = FakeDatastore()
+        uid = fake.add({'title': 'My drawing', 'keep': '1'})
+        writer = JournalWriter(fake)
+        writer.write(uid, {'title': 'My painting'})
+'''
+
+import copy
+
+from gi.repository import GObject
+
+
+class FakeDSObject():
+
+    ''' A stand-in for sugar3.datastore.datastore.DSObject '''
+
+    def __init__(self, object_id, metadata=None, file_path=None):
+        self.object_id = object_id
+        if metadata is None:
+            metadata = {}
+        self.metadata = metadata
+        self.file_path = file_path
+
+    def get_file_path(self):
+        return self.file_path
+
+    def set_file_path(self, file_path):
+        self.file_path = file_path
+
+    def destroy(self):
+        pass
+
+
+class FakeDatastore():
+
+    ''' A stand-in for the sugar3.datastore.datastore module '''
+
+    DSObject = FakeDSObject
+    DSMetadata = dict
+
+    def __init__(self):
+        self._objects = {}  # object_id -> FakeDSObject
+        self._next_id = 0
+        self.writes = []  # (object_id, metadata) for each write
+        self.fail = set()
+        self.gets = 0
+
+    def add(self, metadata, file_path=None):
+        ''' Put an object in the Journal and return its object id. '''
+        self._next_id += 1
+        object_id = 'fake-%d' % (self._next_id)
+        self._objects[object_id] = FakeDSObject(object_id, dict(metadata),
+                                                file_path)
+        return object_id
+
+    def create(self):
+        return FakeDSObject(None)
+
+    def get(self, object_id):
+        self.gets += 1
+        if object_id not in self._objects:
+            raise ValueError('No such object %s' % (object_id))
+        return copy.deepcopy(self._objects[object_id])
+
+    def get_properties(self, object_id, reply_handler, error_handler):
+        if object_id not in self._objects:
+            GObject.idle_add(self._reply, error_handler,
+                             ValueError('No such object %s' % (object_id)))
+            return
+        GObject.idle_add(self._reply, reply_handler,
+                         copy.deepcopy(self._objects[object_id].metadata))
+
+    def find(self, query):
+        found = []
+        for dsobj in self._objects.values():
+            for key, value in query.items():
+                if isinstance(value, list):
+                    if dsobj.metadata.get(key) not in value:
+                        break
+                elif dsobj.metadata.get(key) != value:
+                    break
+            else:
+                found.append(copy.deepcopy(dsobj))
+        return found, len(found)
+
+    def write(self, dsobj, update_mtime=True, transfer_ownership=False,
+              reply_handler=None, error_handler=None, timeout=-1):
+        if dsobj.object_id is None:
+            self._next_id += 1
+            dsobj.object_id = 'fake-%d' % (self._next_id)
+        if dsobj.object_id in self.fail:
+            error = IOError('Could not write %s' % (dsobj.object_id))
+            if error_handler is None:
+                raise error
+            GObject.idle_add(self._reply, error_handler, error)
+            return
+        self._objects[dsobj.object_id] = copy.deepcopy(dsobj)
+        self.writes.append((dsobj.object_id, dict(dsobj.metadata)))
+        if reply_handler is not None:
+            GObject.idle_add(self._reply, reply_handler)
+
+    def _reply(self, handler, *args):
+        handler(*args)
+        return False
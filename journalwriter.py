@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+from collections import OrderedDict
+from functools import partial
+
+try:
+    from sugar3.datastore import dbus_helpers
+except ImportError:
+    dbus_helpers = None  # Only a stand-in datastore can be used
+
+import logging
+_logger = logging.getLogger("portfolio-activity")
+
+# Writes to the datastore that may be waiting for a reply at once
+MAX_IN_FLIGHT = 2
+
+
+class JournalWriter():
+
+    ''' Write metadata changes to Journal objects behind the caller's
+    back. Changes to the same object are merged until they are
+    written, and only a few writes are in flight at a time.
+    written_cb(uid, metadata) is called once everything queued for an
+    object has been written, with the metadata of the last write;
+    error_cb(uid, error) is called if a write fails.
+
+    Nothing waits on the datastore: each write fetches the entry as it
+    is now with an asynchronous get_properties call, and writes the
+    changes on top of it, so that edits made elsewhere in the meantime
+    are kept.
+
+    datastore is sugar3.datastore.datastore, or a stand-in with its own
+    get_properties such as fakedatastore.FakeDatastore. '''
+
+    def __init__(self, datastore, written_cb=None, error_cb=None,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self._datastore = datastore
+        self._written_cb = written_cb
+        self._error_cb = error_cb
+        self._max_in_flight = max_in_flight
+        self._pending = OrderedDict()  # uid -> metadata, oldest first
+        self._in_flight = set()
+        self._fetching = OrderedDict()  # uid -> metadata, awaiting entry
+
+    def write(self, uid, metadata):
+        ''' Queue metadata to be written to the object uid. '''
+        if uid in self._pending:
+            self._pending[uid].update(metadata)
+        else:
+            self._pending[uid] = dict(metadata)
+        self._pump()
+
+    def is_pending(self, uid):
+        ''' Is a write for uid queued or in flight? '''
+        return uid in self._pending or uid in self._in_flight
+
+    def _pump(self):
+        for uid in list(self._pending):
+            if len(self._in_flight) >= self._max_in_flight:
+                break
+            if uid in self._in_flight:
+                continue  # Write again once the current write is done
+            metadata = self._pending.pop(uid)
+            try:
+                self._get_properties(
+                    uid, partial(self._properties_cb, uid, metadata),
+                    partial(self._properties_error_cb, uid, metadata))
+            except Exception as e:
+                self._failed(uid, e)
+                continue
+            self._fetching[uid] = metadata
+            self._in_flight.add(uid)
+
+    def _get_properties(self, uid, reply_handler, error_handler):
+        ''' Fetch the metadata of an object without waiting for it. '''
+        if hasattr(self._datastore, 'get_properties'):
+            self._datastore.get_properties(uid, reply_handler=reply_handler,
+                                           error_handler=error_handler)
+        else:
+            # What datastore.get does, but asynchronously
+            dbus_helpers._get_data_store().get_properties(
+                uid, byte_arrays=True, reply_handler=reply_handler,
+                error_handler=error_handler)
+
+    def _properties_cb(self, uid, metadata, properties):
+        if self._fetching.get(uid) is not metadata:
+            return  # flush() has written it already
+        del self._fetching[uid]
+        properties = dict(properties)
+        properties.update(metadata)
+        # Without a file path, only the metadata is written
+        jobject = self._datastore.DSObject(
+            uid, self._datastore.DSMetadata(properties))
+        try:
+            self._datastore.write(
+                jobject, update_mtime=False,
+                reply_handler=partial(self._reply_cb, uid, jobject,
+                                      metadata),
+                error_handler=partial(self._write_error_cb, uid, jobject))
+        except Exception as e:
+            self._write_error_cb(uid, jobject, e)
+
+    def _properties_error_cb(self, uid, metadata, error):
+        if self._fetching.get(uid) is not metadata:
+            return
+        del self._fetching[uid]
+        self._in_flight.discard(uid)
+        self._failed(uid, error)
+        self._pump()
+
+    def _reply_cb(self, uid, jobject, metadata, *args):
+        self._in_flight.discard(uid)
+        jobject.destroy()
+        if uid not in self._pending and self._written_cb is not None:
+            self._written_cb(uid, metadata)
+        self._pump()
+
+    def _write_error_cb(self, uid, jobject, error):
+        self._in_flight.discard(uid)
+        jobject.destroy()
+        self._failed(uid, error)
+        self._pump()
+
+    def _failed(self, uid, error):
+        _logger.error('Could not write %s: %r' % (uid, error))
+        if self._error_cb is not None:
+            self._error_cb(uid, error)
+
+    def flush(self):
+        ''' Write everything that is still queued, waiting for each
+        write to finish, including writes whose entry is still being
+        fetched. Writes already sent go before these, so they cannot
+        overwrite them. '''
+        queued = self._fetching
+        self._fetching = OrderedDict()
+        for uid in queued:
+            self._in_flight.discard(uid)
+        for uid, metadata in self._pending.items():
+            if uid in queued:
+                queued[uid] = dict(queued[uid])
+                queued[uid].update(metadata)
+            else:
+                queued[uid] = metadata
+        self._pending = OrderedDict()
+        while len(queued) > 0:
+            uid, metadata = queued.popitem(last=False)
+            try:
+                jobject = self._datastore.get(uid)
+                jobject.metadata.update(metadata)
+                self._datastore.write(jobject, update_mtime=False)
+                jobject.destroy()
+            except Exception as e:
+                self._failed(uid, e)
+                continue
+            if uid not in self._in_flight and self._written_cb is not None:
+                self._written_cb(uid, metadata)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+'''
+loopback.py provides in-process stand-ins for the collaboration
+channel, so that sharing can be exercised without a Telepathy server.
+
+LoopbackCollab has the parts of the CollabWrapper interface that
+Portfolio uses (post, send_file_memory and the message, incoming_file,
+buddy_joined and buddy_left signals). Messages and file transfer
+descriptions are passed through JSON, as they are over Telepathy, and
+are delivered from the main loop.
+
+Example usage:
+        sharer_collab = LoopbackCollab('sharer')
+        joiner_collab = LoopbackCollab('joiner')
+        sharer._setup_collab(sharer_collab)
+        joiner._setup_collab(joiner_collab)
+        sharer_collab.connect_peer(joiner_collab)
+'''
+
+import json
+
+from gi.repository import GObject
+from gi.repository import Gio
+
+try:
+    from sugar3.presence.wrapper import FT_STATE_NONE, FT_STATE_OPEN, \
+        FT_STATE_COMPLETED
+except ImportError:
+    from collabwrapper import FT_STATE_NONE, FT_STATE_OPEN, \
+        FT_STATE_COMPLETED
+
+
+class LoopbackBuddy():
+
+    ''' A stand-in for sugar3.presence.buddy.Buddy '''
+
+    def __init__(self, nick):
+        self.nick = nick
+
+
+class LoopbackTransfer(GObject.GObject):
+
+    ''' A stand-in for an IncomingFileTransfer that is fed from memory. '''
+
+    def __init__(self, data, description):
+        GObject.GObject.__init__(self)
+        self._data = data
+        self._output_stream = None
+        self.description = description
+
+    state = GObject.property(type=int, default=FT_STATE_NONE)
+
+    @GObject.Property
+    def output(self):
+        return self._output_stream
+
+    def accept_to_memory(self):
+        self._output_stream = Gio.MemoryOutputStream.new_resizable()
+        GObject.idle_add(self._transfer)
+
+    def _transfer(self):
+        self.props.state = FT_STATE_OPEN
+        self._output_stream.write_all(self._data, None)
+        self.props.state = FT_STATE_COMPLETED
+        return False
+
+
+class LoopbackCollab(GObject.GObject):
+
+    ''' A stand-in for CollabWrapper connecting peers in one process. '''
+
+    message = GObject.Signal('message', arg_types=[object, object])
+    joined = GObject.Signal('joined')
+    buddy_joined = GObject.Signal('buddy_joined', arg_types=[object])
+    buddy_left = GObject.Signal('buddy_left', arg_types=[object])
+    incoming_file = GObject.Signal('incoming_file', arg_types=[object, object])
+
+    def __init__(self, nick):
+        GObject.GObject.__init__(self)
+        self.buddy = LoopbackBuddy(nick)
+        self._peers = []
+
+    def setup(self):
+        pass
+
+    def connect_peer(self, peer):
+        ''' Join two loopback channels, as if the peer joined the share. '''
+        self._peers.append(peer)
+        peer._peers.append(self)
+        self.buddy_joined.emit(peer.buddy)
+        peer.buddy_joined.emit(self.buddy)
+
+    def disconnect_peer(self, peer):
+        ''' The peer leaves the share. '''
+        if peer in self._peers:
+            self._peers.remove(peer)
+            peer._peers.remove(self)
+            self.buddy_left.emit(peer.buddy)
+            peer.buddy_left.emit(self.buddy)
+
+    def post(self, msg):
+        ''' Send a message to all peers. '''
+        text = json.dumps(msg)
+        for peer in self._peers:
+            GObject.idle_add(peer._receive, self.buddy, text)
+
+    def _receive(self, buddy, text):
+        self.message.emit(buddy, json.loads(text))
+        return False
+
+    def send_file_memory(self, buddy, data, description):
+        ''' Send data from memory to one peer. '''
+        text = json.dumps(description)
+        for peer in self._peers:
+            if peer.buddy is buddy:
+                GObject.idle_add(peer._receive_file, data, text)
+
+    def _receive_file(self, data, text):
+        description = json.loads(text)
+        self.incoming_file.emit(LoopbackTransfer(data, text), description)
+        return False
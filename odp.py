@@ -21,7 +21,10 @@
 
 from odf.opendocument import OpenDocumentPresentation
 from odf.style import Style, MasterPage, PageLayout, PageLayoutProperties
-from odf.draw import Page, Frame, Image
+from odf.style import ParagraphProperties, TextProperties
+from odf.draw import Page, Frame, Image, TextBox
+from odf.element import Element
+from odf.namespaces import TEXTNS
 
 
 class TurtleODP:
@@ -46,6 +49,11 @@ class TurtleODP:
             pageheight='%fpt' % height, printorientation='landscape'))
         self.photostyle = Style(name='MyMaster-photo', family='presentation')
         self.doc.styles.addElement(self.photostyle)
+        # Text styles for slides written by add_slide, with font sizes
+        # as in the Portfolio slide view
+        self.titlestyle = self._text_style('MyMaster-title', 36, 'center')
+        self.textstyle = self._text_style('MyMaster-text', 24, 'start')
+        self.commentstyle = self._text_style('MyMaster-comment', 16, 'start')
         self.masterpage = MasterPage(name='MyMaster',
                                      pagelayoutname=pagelayout)
         self.doc.masterstyles.addElement(self.masterpage)
@@ -61,6 +69,74 @@ class TurtleODP:
         photoframe.addElement(Image(href=href))
         # print 'added image successfully'
 
+    def add_slide(self, title, description, comments, picture_path=None,
+                  picture_data=None, mediatype=None, size=None):
+        # Add a slide with its title, description and comments in text
+        # frames, laid out as in the Portfolio slide view. The picture is
+        # stored as it is, either from a file or from data in memory;
+        # size is its (width, height), for its aspect ratio.
+        page = Page(masterpagename=self.masterpage)
+        self.doc.presentation.addElement(page)
+        # Metadata and text entries give UTF-8 strings, but odf writes
+        # text as unicode
+        title, description, comments = [
+            _unicode(text) for text in (title, description, comments)]
+        scale = self.height / 900.
+        margin = 40 * scale
+        width = self.width - 2 * margin
+        self._add_text(page, self.titlestyle, title,
+                       margin, 10 * scale, width, 100 * scale)
+        box = [margin, 110 * scale, 560 * scale, 420 * scale]
+        if picture_path is not None:
+            href = self.doc.addPictureFromFile(picture_path, mediatype)
+        elif picture_data is not None:
+            href = self.doc.addPictureFromString(picture_data, mediatype)
+        else:
+            href = None
+        if href is not None:
+            # Fit the picture in its box, keeping its aspect ratio
+            w, h = box[2:]
+            if size is not None:
+                fit = min(w / size[0], h / size[1])
+                w = size[0] * fit
+                h = size[1] * fit
+            photoframe = Frame(
+                stylename=self.photostyle, width='%fpt' % w,
+                height='%fpt' % h, x='%fpt' % (box[0] + (box[2] - w) / 2),
+                y='%fpt' % (box[1] + (box[3] - h) / 2))
+            page.addElement(photoframe)
+            photoframe.addElement(Image(href=href))
+            self._add_text(page, self.textstyle, description,
+                           box[0] + box[2], box[1], width - box[2], box[3])
+        else:
+            self._add_text(page, self.textstyle, description,
+                           box[0], box[1], width, box[3])
+        top = box[1] + box[3] + 10 * scale
+        self._add_text(page, self.commentstyle, comments,
+                       margin, top, width, self.height - top - margin)
+
+    def _text_style(self, name, size, align):
+        style = Style(name=name, family='presentation')
+        style.addElement(ParagraphProperties(textalign=align))
+        style.addElement(TextProperties(
+            fontsize='%fpt' % (size * self.height / 900.)))
+        self.doc.styles.addElement(style)
+        return style
+
+    def _add_text(self, page, style, text, x, y, width, height):
+        if text is None or len(text) == 0:
+            return
+        frame = Frame(stylename=style, width='%fpt' % width,
+                      height='%fpt' % height, x='%fpt' % x, y='%fpt' % y)
+        page.addElement(frame)
+        textbox = TextBox()
+        frame.addElement(textbox)
+        # A paragraph for each line
+        for line in text.split('\n'):
+            paragraph = Element(qname=(TEXTNS, 'p'))
+            paragraph.addText(line)
+            textbox.addElement(paragraph)
+
     def save_presentation(self):
         # print self.path
         self.doc.save(self.path)
@@ -68,3 +144,9 @@ class TurtleODP:
 
     def get_output_path(self):
         return self.path
+
+
+def _unicode(text):
+    if text is None or isinstance(text, unicode):
+        return text
+    return text.decode('utf-8', 'replace')
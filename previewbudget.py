@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+from collections import OrderedDict
+
+# Memory allowed for decoded previews; an XO-1 has 256 MB in all
+PREVIEW_BUDGET = 32 * 1024 * 1024
+
+
+class PreviewBudget():
+
+    ''' Keep the memory used by decoded previews under a limit. When
+    the limit is passed, the least recently used previews are evicted
+    with evict_cb(key); restore_cb(key) asks for an evicted preview to
+    be decoded again, which is then accounted for with add(). Pinned
+    keys are never evicted. Pixbufs that cannot be evicted, such as
+    copies kept in place of evicted previews, are counted with
+    hold(key, pixbuf), and previews are evicted to make room for them.
+    '''
+
+    def __init__(self, evict_cb, restore_cb, max_bytes=PREVIEW_BUDGET):
+        self._evict_cb = evict_cb
+        self._restore_cb = restore_cb
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size, LRU first
+        self._total = 0
+        self._pinned = set()
+        self._held = {}  # key -> size
+
+    def add(self, key, pixbuf):
+        ''' Account for a new (or replaced) preview. '''
+        self.discard(key)
+        if pixbuf is None:
+            return
+        size = pixbuf.get_rowstride() * pixbuf.get_height()
+        self._entries[key] = size
+        self._total += size
+        self._evict(key)
+
+    def discard(self, key):
+        if key in self._entries:
+            self._total -= self._entries.pop(key)
+
+    def hold(self, key, pixbuf):
+        ''' Count a pixbuf that is kept for key, in place of any held
+        before; None releases it. Held pixbufs are never evicted, but
+        leave less room for previews. '''
+        self._total -= self._held.pop(key, 0)
+        if pixbuf is not None:
+            size = pixbuf.get_rowstride() * pixbuf.get_height()
+            self._held[key] = size
+            self._total += size
+            self._evict(None)
+
+    def touch(self, key):
+        ''' Mark a preview as the most recently used. '''
+        if key in self._entries:
+            self._entries[key] = self._entries.pop(key)
+
+    def restore(self, key):
+        self._restore_cb(key)
+
+    def pin(self, keys):
+        ''' Protect these previews (and only these) from eviction. '''
+        self._pinned = set(keys)
+
+    def _evict(self, keep):
+        for key in list(self._entries):
+            if self._total <= self._max_bytes:
+                break
+            # evict_cb may hold a copy, which evicts in turn
+            if key is keep or key in self._pinned or \
+               key not in self._entries:
+                continue
+            self._total -= self._entries.pop(key)
+            self._evict_cb(key)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+import os
+import json
+from collections import OrderedDict
+
+from gi.repository import GdkPixbuf
+
+import logging
+_logger = logging.getLogger("portfolio-activity")
+
+# Keep the cache small: the XO has very little flash
+PREVIEW_CACHE_SIZE = 8 * 1024 * 1024
+INDEX = 'index.json'
+# Opaque previews are stored as JPEG, which is a fraction of the size
+# of PNG for photos; previews with transparency are stored as PNG
+JPEG_QUALITY = 85
+
+
+class PreviewCache():
+
+    ''' A size-bounded, least-recently-used cache of scaled previews and
+    thumbnails, stored as JPEG or PNG files and keyed by kind, Journal
+    object id and size. Entries are only valid for the mtime they were
+    stored with. An entry is not stored if that would evict entries
+    used since the cache was opened, so that a cache too small for the
+    portfolio does not churn. '''
+
+    def __init__(self, path, max_bytes=PREVIEW_CACHE_SIZE):
+        self._path = path
+        self._max_bytes = max_bytes
+        # key -> [mtime, size, extension], LRU first
+        self._entries = OrderedDict()
+        self._total = 0
+        self._used = set()  # Keys read or written since opening
+        self._dirty = False
+        if not os.path.exists(self._path):
+            try:
+                os.makedirs(self._path)
+            except OSError as e:
+                _logger.error('Could not create preview cache: %s' % e)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self._path, INDEX)) as fd:
+                entries = json.load(fd)
+        except (IOError, OSError, ValueError):
+            entries = []
+        for entry in entries:
+            if len(entry) < 4:
+                entry = entry + ['png']  # Written before JPEG was used
+            key, mtime, size, ext = entry
+            if os.path.exists(self._file(key, ext)):
+                self._entries[key] = [mtime, size, ext]
+                self._total += size
+        # Remove files written after the index was last synced
+        try:
+            for name in os.listdir(self._path):
+                key, ext = os.path.splitext(name)
+                if ext not in ('.png', '.jpg'):
+                    continue
+                if key not in self._entries or \
+                   self._entries[key][2] != ext[1:]:
+                    os.remove(os.path.join(self._path, name))
+        except OSError:
+            pass
+
+    def _key(self, kind, uid, w, h):
+        return '%s-%s-%dx%d' % (kind, str(uid).replace(os.sep, '_'),
+                                int(w), int(h))
+
+    def _file(self, key, ext):
+        return os.path.join(self._path, '%s.%s' % (key, ext))
+
+    def get(self, uid, w, h, mtime, kind='preview'):
+        ''' Return the cached pixbuf, or None if it is missing or stale. '''
+        if mtime is None:
+            return None
+        key = self._key(kind, uid, w, h)
+        if key not in self._entries:
+            return None
+        entry = self._entries.pop(key)
+        if entry[0] != mtime:
+            self._remove(key, entry)
+            return None
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(self._file(key, entry[2]))
+        except Exception as e:
+            _logger.debug('Dropping cache entry %s: %s' % (key, e))
+            self._remove(key, entry)
+            return None
+        self._entries[key] = entry  # Most recently used
+        self._used.add(key)
+        self._dirty = True
+        return pixbuf
+
+    def put(self, uid, w, h, mtime, pixbuf, kind='preview'):
+        ''' Store a pixbuf, evicting the least recently used entries if
+        the cache grows beyond its size limit. '''
+        if mtime is None or pixbuf is None:
+            return
+        key = self._key(kind, uid, w, h)
+        if key in self._entries:
+            self._remove(key, self._entries.pop(key))
+        try:
+            if pixbuf.get_has_alpha():
+                ext = 'png'
+                saved, data = pixbuf.save_to_bufferv('png', [], [])
+            else:
+                ext = 'jpg'
+                saved, data = pixbuf.save_to_bufferv(
+                    'jpeg', ['quality'], [str(JPEG_QUALITY)])
+            if not saved:
+                return
+        except Exception as e:
+            _logger.error('Could not encode preview %s: %s' % (key, e))
+            return
+        size = len(data)
+        if not self._admit(size):
+            _logger.debug('Preview cache full: not storing %s' % (key))
+            return
+        try:
+            with open(self._file(key, ext), 'wb') as fd:
+                fd.write(data)
+        except (IOError, OSError) as e:
+            _logger.error('Could not cache preview %s: %s' % (key, e))
+            return
+        self._entries[key] = [mtime, size, ext]
+        self._used.add(key)
+        self._total += size
+        self._dirty = True
+        while self._total > self._max_bytes and len(self._entries) > 1:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._remove(old_key, old_entry)
+
+    def _admit(self, size):
+        ''' Is there room for size bytes without evicting entries that
+        have been used since the cache was opened? '''
+        needed = self._total + size - self._max_bytes
+        for key, entry in self._entries.items():
+            if needed <= 0:
+                break
+            if key in self._used:
+                return False
+            needed -= entry[1]
+        return needed <= 0
+
+    def _remove(self, key, entry):
+        self._total -= entry[1]
+        self._used.discard(key)
+        self._dirty = True
+        try:
+            os.remove(self._file(key, entry[2]))
+        except OSError:
+            pass
+
+    def sync(self):
+        ''' Write the index to disk (if it has changed). '''
+        if not self._dirty:
+            return
+        entries = [[key] + entry for key, entry in self._entries.items()]
+        try:
+            with open(os.path.join(self._path, INDEX), 'w') as fd:
+                json.dump(entries, fd)
+            self._dirty = False
+        except (IOError, OSError) as e:
+            _logger.error('Could not write preview cache index: %s' % e)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# You should have received a copy of the GNU General Public License
+# along with this library; if not, write to the Free Software
+# Foundation, 51 Franklin Street, Suite 500 Boston, MA 02110-1335 USA
+
+import gi
+gi.require_version('Gdk', '3.0')
+gi.require_version('PangoCairo', '1.0')
+from gi.repository import Gdk
+from gi.repository import Pango
+from gi.repository import PangoCairo
+import cairo
+
+from utils import blank_surface, parse_comments, rgb
+
+
+class SlideRenderer():
+
+    ''' Paint slides as the slide view lays them out, but onto any
+    cairo context rather than the canvas, so slides can be exported
+    without showing them. rects maps 'title', 'preview', 'description'
+    and 'comment' to the (x, y, w, h) of that part of the slide. '''
+
+    def __init__(self, width, height, colors, rects, title_size, desc_size):
+        self.width = int(width)
+        self.height = int(height)
+        self._colors = colors
+        self._rects = dict((key, [int(v) for v in rect])
+                           for key, rect in rects.items())
+        self._title_size = title_size
+        self._desc_size = desc_size
+        self._fd = Pango.FontDescription('Sans')
+
+    def render(self, slide):
+        ''' Return an image surface with the slide painted on it. '''
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, self.width,
+                                     self.height)
+        cr = cairo.Context(surface)
+        self.paint(cr, slide)
+        surface.flush()
+        return surface
+
+    def get_rect(self, key):
+        ''' The (x, y, w, h) of a part of the slide '''
+        return tuple(self._rects[key])
+
+    def paint(self, cr, slide, image=None):
+        ''' Paint the slide onto cr, at the size the renderer is for.
+        image, a pixbuf or a cairo image surface, is painted in place of
+        the preview. '''
+        cr.save()
+        cr.rectangle(0, 0, self.width, self.height)
+        cr.clip()
+        cr.set_source_rgb(*rgb(self._colors[0]))
+        cr.paint()
+        margin = int(self._desc_size / 2)
+        self._box(cr, 'title', slide.title, self._title_size, 'center', 0)
+        self._box(cr, 'description', slide.description, self._desc_size,
+                  'left', margin)
+        self._box(cr, 'comment', parse_comments(slide.comment),
+                  int(self._desc_size * 0.67), 'left', margin)
+        if image is None and slide.has_preview:
+            image = slide.preview
+        if image is not None:
+            self._image(cr, image)
+        cr.restore()
+
+    def _box(self, cr, key, text, size, align, margin):
+        ''' A text box: the background of a label sprite and its text,
+        centred or top left. '''
+        x, y, w, h = self._rects[key]
+        cr.set_source_surface(blank_surface(w, h, self._colors), x, y)
+        cr.paint()
+        if text is None or len(text) == 0:
+            return
+        width = max(0, w - 2 * margin)
+        pl = PangoCairo.create_layout(cr)
+        pl.set_wrap(Pango.WrapMode.WORD)
+        pl.set_width(width * Pango.SCALE)
+        pl.set_text(text.replace('\0', ' '), -1)
+        fd = self._fd.copy()
+        fd.set_size(int(size * Pango.SCALE))
+        pl.set_font_description(fd)
+        lw, lh = [v / Pango.SCALE for v in pl.get_size()]
+        cr.save()
+        cr.rectangle(x, y, w, h)
+        cr.clip()
+        if align == 'center':
+            cr.translate(int(x + margin + (width - lw) / 2),
+                         int(y + (h - lh) / 2))
+        else:
+            cr.translate(x + margin, y + margin)
+        cr.set_source_rgb(0, 0, 0)
+        PangoCairo.update_layout(cr, pl)
+        PangoCairo.show_layout(cr, pl)
+        cr.restore()
+
+    def _image(self, cr, image):
+        ''' The image, scaled to fit its place on the slide '''
+        x, y, w, h = self._rects['preview']
+        scale = min(float(w) / image.get_width(),
+                    float(h) / image.get_height())
+        cr.save()
+        cr.translate(x + (w - image.get_width() * scale) / 2,
+                     y + (h - image.get_height() * scale) / 2)
+        cr.scale(scale, scale)
+        if isinstance(image, cairo.Surface):
+            cr.set_source_surface(image, 0, 0)
+        else:
+            Gdk.cairo_set_source_pixbuf(cr, image, 0, 0)
+        cr.get_source().set_filter(cairo.FILTER_GOOD)
+        cr.paint()
+        cr.restore()
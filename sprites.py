@@ -80,15 +80,46 @@ import gi
 from gi.repository import Gtk, GdkPixbuf, Gdk
 from gi.repository import Pango, PangoCairo
 
+import cairo
 
-class Sprites:
+from bisect import insort
+from collections import OrderedDict
+
+# Size of the cells in the grid used to find sprites by position
+CELL_SIZE = 128
+
+# Laid-out texts kept per label, so that the next text to be shown can
+# be prepared ahead of time
+LABEL_LAYOUTS = 3
+
+
+class Sprites(object):
 
     ''' A class for the list of sprites and everything they share in common '''
 
     def __init__(self, widget):
         ''' Initialize an empty array of sprites '''
         self.widget = widget
-        self.list = []
+        # Sprites are kept in one bucket per layer, in drawing order, so
+        # that changing layers, hiding and restoring are cheap.
+        self._layers = {}  # layer -> OrderedDict of sprites
+        self._layer_keys = []  # sorted list of layers
+        self._sprite_layers = {}  # sprite -> layer of its bucket
+        # A uniform grid of the visible sprites, for hit testing
+        self._grid = {}  # (column, row) -> set of sprites
+        self._sprite_cells = {}  # sprite -> cells it is listed in
+        self._sprite_order = {}  # sprite -> when it joined its layer
+        self._sequence = 0
+
+    @property
+    def list(self):
+        ''' The sprites, bottom first, in drawing order '''
+        return list(self._iter_sprites())
+
+    def _iter_sprites(self):
+        for layer in self._layer_keys:
+            for spr in self._layers[layer]:
+                yield spr
 
     def set_cairo_context(self, cr):
         ''' Cairo context may be set or reset after __init__ '''
@@ -96,44 +127,80 @@ class Sprites:
 
     def get_sprite(self, i):
         ''' Return a sprint from the array '''
-        if i < 0 or i > len(self.list) - 1:
+        if i < 0 or i > len(self._sprite_layers) - 1:
             return(None)
         else:
             return(self.list[i])
 
     def length_of_list(self):
         ''' How many sprites are there? '''
-        return(len(self.list))
+        return(len(self._sprite_layers))
 
     def append_to_list(self, spr):
-        ''' Append a new sprite to the end of the list. '''
-        self.list.append(spr)
+        ''' Append a new sprite to the end of its layer. '''
+        if spr in self._sprite_layers:
+            return
+        if spr.layer not in self._layers:
+            self._layers[spr.layer] = OrderedDict()
+            insort(self._layer_keys, spr.layer)
+        self._layers[spr.layer][spr] = True
+        self._sprite_layers[spr] = spr.layer
+        self._sequence += 1
+        self._sprite_order[spr] = self._sequence
+        self._add_to_grid(spr)
 
     def insert_in_list(self, spr, i):
-        ''' Insert a sprite at position i. '''
-        if i < 0:
-            self.list.insert(0, spr)
-        elif i > len(self.list) - 1:
-            self.list.append(spr)
-        else:
-            self.list.insert(i, spr)
+        ''' Insert a sprite. The list is always kept sorted by layer, so
+        the sprite goes to the end of its layer rather than position i. '''
+        self.append_to_list(spr)
 
     def remove_from_list(self, spr):
         ''' Remove a sprite from the list. '''
-        if spr in self.list:
-            self.list.remove(spr)
+        if spr in self._sprite_layers:
+            layer = self._sprite_layers.pop(spr)
+            del self._layers[layer][spr]
+            del self._sprite_order[spr]
+            self._remove_from_grid(spr)
+
+    def update_sprite(self, spr):
+        ''' A sprite has moved or changed size. '''
+        if spr in self._sprite_cells:
+            self._remove_from_grid(spr)
+            self._add_to_grid(spr)
+
+    def _add_to_grid(self, spr):
+        x, y, w, h = spr.rect
+        cells = [(column, row)
+                 for column in range(x // CELL_SIZE, (x + w) // CELL_SIZE + 1)
+                 for row in range(y // CELL_SIZE, (y + h) // CELL_SIZE + 1)]
+        for cell in cells:
+            if cell not in self._grid:
+                self._grid[cell] = set()
+            self._grid[cell].add(spr)
+        self._sprite_cells[spr] = cells
+
+    def _remove_from_grid(self, spr):
+        for cell in self._sprite_cells.pop(spr):
+            self._grid[cell].discard(spr)
+            if len(self._grid[cell]) == 0:
+                del self._grid[cell]
 
     def find_sprite(self, pos):
         ''' Search based on (x, y) position. Return the 'top/first' one. '''
-        list = self.list[:]
-        list.reverse()
-        for spr in list:
+        cell = (int(pos[0]) // CELL_SIZE, int(pos[1]) // CELL_SIZE)
+        top = None
+        for spr in self._grid.get(cell, ()):
             if spr.hit(pos):
-                return spr
-        return None
+                key = (spr.layer, self._sprite_order[spr])
+                if top is None or key > top[0]:
+                    top = (key, spr)
+        if top is None:
+            return None
+        return top[1]
 
     def redraw_sprites(self, area=None, cr=None):
-        ''' Redraw the sprites that intersect area. '''
+        ''' Redraw the sprites that intersect area, which may be a
+        rectangle or a list of (x, y, width, height) rectangles. '''
         # I think I need to do this to save Cairo some work
         if cr is None:
             cr = self.cr
@@ -142,13 +209,17 @@ class Sprites:
         if cr is None:
             print 'sprites.redraw_sprites: no Cairo context'
             return
-        for spr in self.list:
-            if area is None:
+        if area is None:
+            for spr in self._iter_sprites():
                 spr.draw(cr=cr)
-            else:
-                intersection = spr.rect.intersect(area)
-                if intersection.width > 0 or intersection.height > 0:
+            return
+        if hasattr(area, 'width'):
+            area = [(area.x, area.y, area.width, area.height)]
+        for spr in self._iter_sprites():
+            for rect in area:
+                if spr.intersects(rect):
                     spr.draw(cr=cr)
+                    break
 
 
 class Sprite:
@@ -167,6 +238,8 @@ class Sprite:
         self._x_pos = [None]
         self._y_pos = [None]
         self._fd = None
+        # Per label, key -> (layout, width, height), least recent first
+        self._layouts = [OrderedDict()]
         self._bold = False
         self._italic = False
         self._color = None
@@ -176,6 +249,7 @@ class Sprite:
         self.images = []
         self._dx = []  # image offsets
         self._dy = []
+        self._surface = None  # the images composited for drawing
         self.type = None
         self.set_image(image)
         self._sprites.append_to_list(self)
@@ -189,7 +263,8 @@ class Sprite:
         self.images[i] = image
         self._dx[i] = dx
         self._dy[i] = dy
-        if isinstance(self.images[i], GdkPixbuf.Pixbuf):
+        self._surface = None
+        if isinstance(self.images[i], (GdkPixbuf.Pixbuf, cairo.ImageSurface)):
             w = self.images[i].get_width()
             h = self.images[i].get_height()
         else:
@@ -202,11 +277,13 @@ class Sprite:
                 self.rect[2] = w + dx
             if h + dy > self.rect[3]:
                 self.rect[3] = h + dy
+        self._sprites.update_sprite(self)
 
     def move(self, pos):
         ''' Move to new (x, y) position '''
         self.inval()
         self.rect[0], self.rect[1] = int(pos[0]), int(pos[1])
+        self._sprites.update_sprite(self)
         self.inval()
 
     def move_relative(self, pos):
@@ -214,6 +291,7 @@ class Sprite:
         self.inval()
         self.rect[0] += int(pos[0])
         self.rect[1] += int(pos[1])
+        self._sprites.update_sprite(self)
         self.inval()
 
     def get_xy(self):
@@ -235,27 +313,32 @@ class Sprite:
         self.inval()
 
     def set_layer(self, layer=None):
-        ''' Set the layer for a sprite '''
+        ''' Set the layer for a sprite. It is drawn above the other
+        sprites already in that layer. '''
         self._sprites.remove_from_list(self)
         if layer is not None:
             self.layer = layer
-        for i in range(self._sprites.length_of_list()):
-            if self.layer < self._sprites.get_sprite(i).layer:
-                self._sprites.insert_in_list(self, i)
-                self.inval()
-                return
         self._sprites.append_to_list(self)
         self.inval()
 
     def set_label(self, new_label, i=0):
         ''' Set the label drawn on the sprite '''
         self._extend_labels_array(i)
+        self.labels[i] = self._label_text(new_label)
+        self.inval()
+
+    def prepare_label(self, new_label, i=0):
+        ''' Lay out a label that is about to be set, so that drawing it
+        will not have to. '''
+        self._extend_labels_array(i)
+        width = max(0, self.rect[2] - self._margins[0] - self._margins[2])
+        self._get_layout(None, i, width, self._label_text(new_label))
+
+    def _label_text(self, new_label):
         if isinstance(new_label, str) or isinstance(new_label, unicode):
             # pango doesn't like nulls
-            self.labels[i] = new_label.replace("\0", " ")
-        else:
-            self.labels[i] = str(new_label)
-        self.inval()
+            return new_label.replace("\0", " ")
+        return str(new_label)
 
     def set_margins(self, l=0, t=0, r=0, b=0):
         ''' Set the margins for drawing the label '''
@@ -275,10 +358,12 @@ class Sprite:
             self._vert_align.append(self._vert_align[0])
             self._x_pos.append(self._x_pos[0])
             self._y_pos.append(self._y_pos[0])
+            self._layouts.append(OrderedDict())
 
     def set_font(self, font):
         ''' Set the font for a label '''
         self._fd = Pango.FontDescription(font)
+        self._layouts = [OrderedDict() for layouts in self._layouts]
 
     def set_label_color(self, rgb):
         ''' Set the font color for a label '''
@@ -323,6 +408,25 @@ class Sprite:
                                              self.rect[2],
                                              self.rect[3])
 
+    def _composite(self):
+        ''' Convert the images to cairo's pixel format once, flattening
+        them into a single surface the size of the sprite. '''
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                     max(1, self.rect[2]),
+                                     max(1, self.rect[3]))
+        cr = cairo.Context(surface)
+        for i, img in enumerate(self.images):
+            if isinstance(img, GdkPixbuf.Pixbuf):
+                Gdk.cairo_set_source_pixbuf(cr, img, self._dx[i], self._dy[i])
+            elif isinstance(img, cairo.Surface):
+                cr.set_source_surface(img, self._dx[i], self._dy[i])
+            else:
+                print 'sprite.draw: source not a pixbuf (%s)' % (type(img))
+                continue
+            cr.paint()
+        surface.flush()
+        return surface
+
     def draw(self, cr=None):
         ''' Draw the sprite (and label) '''
         if cr is None:
@@ -330,21 +434,20 @@ class Sprite:
         if cr is None:
             print 'sprite.draw: no Cairo context.'
             return
-        for i, img in enumerate(self.images):
-            if isinstance(img, GdkPixbuf.Pixbuf):
-                Gdk.cairo_set_source_pixbuf(cr, img,
-                                            self.rect[0] + self._dx[i],
-                                            self.rect[1] + self._dy[i])
-                cr.rectangle(self.rect[0] + self._dx[i],
-                             self.rect[1] + self._dy[i],
-                             self.rect[2],
-                             self.rect[3])
-                cr.fill()
-            else:
-                print 'sprite.draw: source not a pixbuf (%s)' % (type(img))
+        if self._surface is None:
+            self._surface = self._composite()
+        cr.set_source_surface(self._surface, self.rect[0], self.rect[1])
+        cr.rectangle(self.rect[0], self.rect[1], self.rect[2], self.rect[3])
+        cr.fill()
         if len(self.labels) > 0:
             self.draw_label(cr)
 
+    def intersects(self, rect):
+        ''' Does the sprite overlap an (x, y, width, height) rectangle? '''
+        x, y, w, h = rect
+        return self.rect[0] < x + w and x < self.rect[0] + self.rect[2] and \
+            self.rect[1] < y + h and y < self.rect[1] + self.rect[3]
+
     def hit(self, pos):
         ''' Is (x, y) on top of the sprite? '''
         x, y = pos
@@ -358,6 +461,41 @@ class Sprite:
             return False
         return True
 
+    def _get_layout(self, cr, i, width, text=None):
+        ''' Return (layout, width, height) for label i (or for text in
+        the place of label i). Layouts are kept for the last few texts,
+        scales, fonts and widths, and only shaped when these change. '''
+        if text is None:
+            text = self.labels[i]
+        key = (text, self._scale[i], self._rescale[i], width)
+        layouts = self._layouts[i]
+        if key in layouts:
+            layouts[key] = layouts.pop(key)  # Most recently used
+            return layouts[key]
+        if cr is None:
+            pl = Pango.Layout.new(self._sprites.widget.create_pango_context())
+        else:
+            pl = PangoCairo.create_layout(cr)
+        pl.set_wrap(Pango.WrapMode.WORD)
+        pl.set_width(width * Pango.SCALE)
+        pl.set_text(str(text), -1)
+        fd = self._fd.copy()
+        fd.set_size(int(self._scale[i] * Pango.SCALE))
+        pl.set_font_description(fd)
+        w = pl.get_size()[0] / Pango.SCALE
+        if w > width:
+            if self._rescale[i]:
+                fd.set_size(int(self._scale[i] * Pango.SCALE * width / w))
+                pl.set_font_description(fd)
+            else:
+                pl.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+            w = pl.get_size()[0] / Pango.SCALE
+        h = pl.get_size()[1] / Pango.SCALE
+        layouts[key] = (pl, w, h)
+        while len(layouts) > LABEL_LAYOUTS:
+            layouts.popitem(last=False)
+        return pl, w, h
+
     def draw_label(self, cr):
         ''' Draw the label based on its attributes '''
         my_width = self.rect[2] - self._margins[0] - self._margins[2]
@@ -365,24 +503,7 @@ class Sprite:
             my_width = 0
         my_height = self.rect[3] - self._margins[1] - self._margins[3]
         for i in range(len(self.labels)):
-            pl = PangoCairo.create_layout(cr)
-            pl.set_wrap(Pango.WrapMode.WORD)
-            pl.set_width(my_width * Pango.SCALE)
-            pl.set_text(str(self.labels[i]), -1)
-            self._fd.set_size(int(self._scale[i] * Pango.SCALE))
-            pl.set_font_description(self._fd)
-            w = pl.get_size()[0] / Pango.SCALE
-            if w > my_width:
-                if self._rescale[i]:
-                    self._fd.set_size(
-                        int(self._scale[i] * Pango.SCALE * my_width / w))
-                    pl.set_font_description(self._fd)
-                    w = pl.get_size()[0] / Pango.SCALE
-                else:
-                    pl.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
-                    self._fd.set_size(int(self._scale[i] * Pango.SCALE))
-                    pl.set_font_description(self._fd)
-                    w = pl.get_size()[0] / Pango.SCALE
+            pl, w, h = self._get_layout(cr, i, my_width)
             if self._x_pos[i] is not None:
                 x = int(self.rect[0] + self._x_pos[i])
             elif self._horiz_align[i] == "center":
@@ -391,7 +512,6 @@ class Sprite:
                 x = int(self.rect[0] + self._margins[0])
             else:  # right
                 x = int(self.rect[0] + self.rect[2] - w - self._margins[2])
-            h = pl.get_size()[1] / Pango.SCALE
             if self._y_pos[i] is not None:
                 y = int(self.rect[1] + self._y_pos[i])
             elif self._vert_align[i] == "middle":
@@ -415,8 +535,9 @@ class Sprite:
         for i in range(len(self.labels)):
             pl = PangoCairo.create_layout(cr)
             pl.set_text(str(self.labels[i]), -1)
-            self._fd.set_size(int(self._scale[i] * Pango.SCALE))
-            pl.set_font_description(self._fd)
+            fd = self._fd.copy()
+            fd.set_size(int(self._scale[i] * Pango.SCALE))
+            pl.set_font_description(fd)
             w = pl.get_size()[0] / Pango.SCALE
             if w > max:
                 max = w
@@ -12,8 +12,12 @@
 
 
 from gi.repository import GdkPixbuf
+import cairo
 import os
+import base64
 import subprocess
+from collections import OrderedDict
+from math import pi
 
 from gettext import gettext as _
 
@@ -23,6 +27,11 @@ XO175 = 'xo1.75'
 XO4 = 'xo4'
 UNKNOWN = 'unknown'
 
+# Rendered backgrounds are shared by every sprite of the same size and
+# colors; keep the most recently used ones.
+BACKGROUND_CACHE_SIZE = 32
+_backgrounds = OrderedDict()
+
 
 def get_tablet_mode():
     if not os.path.exists('/dev/input/event4'):
@@ -162,55 +171,90 @@ def svg_rectangle(width, height, colors):
            width - 15, height - 15, colors[0])
 
 
+def blank_surface(w, h, colors, stroke_width=1.0):
+    ''' The rectangle drawn by genblank, as a cairo surface '''
+    return _get_background('blank', w, h, colors, stroke_width)
+
+
+def rectangle_surface(width, height, colors):
+    ''' The frame drawn by svg_rectangle, as a cairo surface '''
+    return _get_background('frame', width, height, colors, 5)
+
+
+def _get_background(kind, w, h, colors, stroke_width):
+    key = (kind, int(w), int(h), tuple(colors), stroke_width)
+    if key in _backgrounds:
+        surface = _backgrounds.pop(key)
+    else:
+        surface = _draw_background(*key)
+    _backgrounds[key] = surface  # Most recently used
+    while len(_backgrounds) > BACKGROUND_CACHE_SIZE:
+        _backgrounds.popitem(last=False)
+    return surface
+
+
+def _draw_background(kind, w, h, colors, stroke_width):
+    ''' Draw the background with cairo rather than parsing SVG '''
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(1, w), max(1, h))
+    cr = cairo.Context(surface)
+    cr.set_line_join(cairo.LINE_JOIN_ROUND)
+    cr.set_line_width(stroke_width)
+    if kind == 'blank':
+        _rounded_rectangle(cr, 0.25, 0.25, w - 0.5, h - 0.5, 1)
+        cr.set_source_rgb(*rgb(colors[1]))
+        cr.fill_preserve()
+        cr.set_source_rgb(*rgb(colors[0]))
+        cr.stroke()
+    else:  # frame
+        cr.rectangle(2.5, 2.5, w - 5, h - 5)
+        cr.set_source_rgb(*rgb(colors[1]))
+        cr.stroke()
+        cr.rectangle(7.5, 7.5, w - 15, h - 15)
+        cr.set_source_rgb(*rgb(colors[0]))
+        cr.stroke()
+    surface.flush()
+    return surface
+
+
+def _rounded_rectangle(cr, x, y, w, h, r):
+    cr.new_sub_path()
+    cr.arc(x + w - r, y + r, r, -pi / 2, 0)
+    cr.arc(x + w - r, y + h - r, r, 0, pi / 2)
+    cr.arc(x + r, y + h - r, r, pi / 2, pi)
+    cr.arc(x + r, y + r, r, pi, 3 * pi / 2)
+    cr.close_path()
+
+
 def load_svg_from_file(file_path, width, height):
     '''Create a pixbuf from SVG in a file. '''
     return GdkPixbuf.Pixbuf.new_from_file_at_size(file_path, width, height)
 
 
-def file_to_base64(activity, path):
-    ''' Given a file, convert its contents to base64 '''
-    base64 = os.path.join(get_path(activity, 'instance'), 'base64tmp')
-    cmd = 'base64 <' + path + ' >' + base64
-    subprocess.check_call(cmd, shell=True)
-    file_handle = open(base64, 'r')
-    data = file_handle.read()
-    file_handle.close()
-    os.remove(base64)
+def pixbuf_to_png(pixbuf, width, height):
+    ''' Scale a pixbuf and encode it as PNG data in memory '''
+    pixbuf = pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.NEAREST)
+    success, data = pixbuf.save_to_bufferv('png', [], [])
     return data
 
 
-def pixbuf_to_base64(activity, pixbuf, width=100, height=75):
-    ''' Convert pixbuf to base64-encoded data '''
-    png_file = os.path.join(get_path(activity, 'instance'), 'imagetmp.png')
-    if pixbuf is not None:
-        pixbuf = pixbuf.scale_simple(
-            width,
-            height,
-            GdkPixbuf.InterpType.NEAREST)
-        pixbuf.savev(png_file, "png", [], [])
-    data = file_to_base64(activity, png_file)
-    os.remove(png_file)
-    return data
+def base64_to_pixbuf(activity, data, width=300, height=225):
+    ''' Convert base64-encoded data to a pixbuf '''
+    return data_to_pixbuf(base64.b64decode(data), width, height)
 
 
-def base64_to_file(activity, data, path):
-    ''' Given a file, convert its contents from base64 '''
-    base64 = os.path.join(get_path(activity, 'instance'), 'base64tmp')
-    file_handle = open(base64, 'w')
-    file_handle.write(data)
-    file_handle.close()
-    cmd = 'base64 -d <' + base64 + '>' + path
-    subprocess.check_call(cmd, shell=True)
-    os.remove(base64)
+def data_to_pixbuf(data, width, height):
+    ''' Load a pixbuf from image data in memory, scaled to fit within
+    width x height while preserving its aspect ratio. '''
+    pixbufloader = GdkPixbuf.PixbufLoader()
+    pixbufloader.connect('size-prepared', _scale_to_fit_cb, width, height)
+    pixbufloader.write(data)
+    pixbufloader.close()
+    return pixbufloader.get_pixbuf()
 
 
-def base64_to_pixbuf(activity, data, width=300, height=225):
-    ''' Convert base64-encoded data to a pixbuf '''
-    png_file = os.path.join(get_path(activity, 'instance'), 'imagetmp.png')
-    base64_to_file(activity, data, png_file)
-    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(png_file, width, height)
-    os.remove(png_file)
-    return pixbuf
+def _scale_to_fit_cb(pixbufloader, w, h, width, height):
+    scale = min(float(width) / w, float(height) / h)
+    pixbufloader.set_size(max(1, int(w * scale)), max(1, int(h * scale)))
 
 
 def get_pixbuf_from_journal(dsobject, w, h):